@@ -0,0 +1,84 @@
+""" In this module:
+Class BroadPhase
+Class BroadPhaseStats
+"""
+
+
+
+class BroadPhaseStats:
+    """Counters over the frames simulated, to see how much grid work the broad phase saves"""
+    def __init__(self):
+        self.frames = 0  # one per rider per frame
+        self.cell_lookups = 0  # grid cells read, by the broad phase and by the queries it could not serve
+        self.candidates = 0  # solid lines gathered by the broad phase
+        self.queries = 0  # per-point queries
+        self.hits = 0  # queries served from the candidates
+
+    def __repr__(self):
+        return (f'{self.candidates_per_frame:.1f} candidate lines and {self.cell_lookups_per_frame:.1f} '
+                f'cell lookups per frame, {self.hit_rate:.1%} of {self.queries} queries served from the candidates')
+
+    @property
+    def candidates_per_frame(self):
+        return self.candidates / self.frames if self.frames else 0
+
+    @property
+    def cell_lookups_per_frame(self):
+        return self.cell_lookups / self.frames if self.frames else 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.queries if self.queries else 0
+
+
+class BroadPhase:
+    """Solid lines a rider may collide with during one frame.
+    The region swept by the rider is the union of the boxes of its points, from r0 to r and padded by a margin,
+    snapped to the grid. Its cells are read once at the start of the frame. A point whose trajectory stays
+    within its box can only hit lines registered in these cells, so its queries are answered from the candidates,
+    without the grid. Points pushed out of their box by constraints fall back to the grid.
+    grid: the Grid of the track, or its CompiledGrid while frozen"""
+    def __init__(self, grid, points, margin: float, queried_cells=None, stats: BroadPhaseStats = None):
+        self.grid = grid
+        self.queried_cells = queried_cells
+        self.stats = stats
+        self.boxes = dict()  # point index -> (xmin, ymin, xmax, ymax) of the cells covering its trajectory
+        cells = set()
+        g = grid.spacing
+        for pnt in points:
+            r, r0 = pnt.r, pnt.r0
+            xmin, ymin = grid.grid_floor(min(r.x, r0.x) - margin), grid.grid_floor(min(r.y, r0.y) - margin)
+            xmax, ymax = grid.grid_floor(max(r.x, r0.x) + margin) + g, grid.grid_floor(max(r.y, r0.y) + margin) + g
+            self.boxes[pnt.i] = xmin, ymin, xmax, ymax
+            cells.update((x, y) for x in range(xmin, xmax, g) for y in range(ymin, ymax, g))
+
+        candidates = set()
+        for cell in cells:
+            candidates.update(grid.solid_lines_in(cell))
+        self.candidates = sorted(candidates)  # same order whatever the grid
+        if queried_cells is not None:
+            queried_cells.update(cells)
+        if stats is not None:
+            stats.frames += 1
+            stats.cell_lookups += len(cells)
+            stats.candidates += len(self.candidates)
+
+    def get_solid_lines(self, pnt):
+        """returns the IDs of the solid lines the point may collide with, like Grid.get_solid_lines"""
+        r, r0 = pnt.r, pnt.r0
+        xmin, ymin, xmax, ymax = self.boxes[pnt.i]
+        inside = (xmin <= min(r.x, r0.x) and max(r.x, r0.x) < xmax
+                  and ymin <= min(r.y, r0.y) and max(r.y, r0.y) < ymax)
+        if self.stats is not None:
+            self.stats.queries += 1
+            self.stats.hits += inside
+        if inside:
+            return self.candidates
+        if self.stats is None:
+            return self.grid.get_solid_lines(pnt, self.queried_cells)
+        cells = set()
+        line_ids = self.grid.get_solid_lines(pnt, cells)
+        self.stats.cell_lookups += len(cells)
+        if self.queried_cells is not None:
+            self.queried_cells.update(cells)
+        return line_ids
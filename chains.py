@@ -0,0 +1,157 @@
+""" In this module:
+Class Chains
+"""
+
+from array import array
+from collections import deque
+from itertools import count
+
+from line_store import LineStore
+
+NONE = -1  # chain of an ID without line
+
+
+class Chains:
+    """Lines of a track joined into chains: runs of connected lines of the same ink, each r2 the r1 of the next,
+    as pencil strokes are drawn. Chains are kept up to date line by line (see Track.add_line), for a chain to be
+    drawn as a single polyline (see LineLayer).
+    Chains are keyed by IDs that are never reused, and have a version that changes with their lines.
+    An endpoint shared by more than two lines joins two of them only. A chain that comes back to its start is closed"""
+    def __init__(self, lines: LineStore):
+        self.lines = lines
+        self.chain_of = array('q')  # line ID -> chain ID
+        self.members = dict()  # chain ID -> deque of line IDs, in order
+        self.versions = dict()  # chain ID -> version
+        self.heads = dict()  # (ink code, x, y) -> open chain starting there
+        self.tails = dict()  # (ink code, x, y) -> open chain ending there
+        self.ends = dict()  # open chain ID -> its keys in heads and tails
+        self.closed = set()  # IDs of the closed chains
+        self.ids = count()
+        self.clock = count()
+        for line_id in lines.ids():
+            self.add(line_id)
+
+    def __repr__(self):
+        return f'Chains({len(self.members)} chains of {len(self.lines)} lines)'
+
+    def __len__(self):
+        return len(self.members)
+
+    def chains_of(self, line_ids):
+        """IDs of the chains of the lines"""
+        chain_of = self.chain_of
+        return {chain_of[line_id] for line_id in line_ids}
+
+    def ink(self, chain):
+        return self.lines.ink(self.members[chain][0])
+
+    def coords(self, chain):
+        """x, y, x, y... of the points of the chain"""
+        lines = self.lines
+        members = self.members[chain]
+        coords = [lines.x1[members[0]], lines.y1[members[0]]]
+        for line_id in members:
+            coords += (lines.x2[line_id], lines.y2[line_id])
+        return coords
+
+    def is_last(self, line_id):
+        """Whether the line ends its chain"""
+        return self.members[self.chain_of[line_id]][-1] == line_id
+
+    def add(self, line_id):
+        """Joins a line added to the track to the chains it connects to"""
+        lines = self.lines
+        ink = lines.inks[line_id]
+        before = self.tails.get((ink, lines.x1[line_id], lines.y1[line_id]))
+        after = self.heads.get((ink, lines.x2[line_id], lines.y2[line_id]))
+        if before is not None and before == after:  # comes back to the start
+            self.unindex(before)
+            self.members[before].append(line_id)
+            self.assign([line_id], before)
+            self.closed.add(before)
+        elif before is not None and after is not None:  # joins two chains: the lines of the shorter one move
+            self.unindex(before)
+            self.unindex(after)
+            if len(self.members[before]) >= len(self.members[after]):
+                moved = self.members.pop(after)
+                self.members[before].append(line_id)
+                self.members[before].extend(moved)
+                self.assign([line_id, *moved], before)
+                self.index(before)
+            else:
+                moved = self.members.pop(before)
+                self.members[after].appendleft(line_id)
+                self.members[after].extendleft(reversed(moved))
+                self.assign([*moved, line_id], after)
+                self.index(after)
+            del self.versions[after if before in self.members else before]
+        elif before is not None:
+            self.unindex(before)
+            self.members[before].append(line_id)
+            self.assign([line_id], before)
+            self.index(before)
+        elif after is not None:
+            self.unindex(after)
+            self.members[after].appendleft(line_id)
+            self.assign([line_id], after)
+            self.index(after)
+        else:
+            self.new_chain(deque([line_id]))
+
+    def remove(self, line_id):
+        """Splits the chain of a line removed from the track"""
+        chain = self.chain_of[line_id]
+        self.chain_of[line_id] = NONE
+        members = list(self.members[chain])
+        self.unindex(chain)
+        k = members.index(line_id)
+        first, second = members[:k], members[k + 1:]
+        if chain in self.closed:  # opens at the line
+            self.closed.discard(chain)
+            first, second = second + first, []
+        if len(second) > len(first):  # the lines of the shorter part move
+            first, second = second, first
+        if first:
+            self.members[chain] = deque(first)
+            self.versions[chain] = next(self.clock)
+            self.index(chain)
+        else:
+            del self.members[chain], self.versions[chain]
+        if second:
+            self.new_chain(deque(second))
+
+    def new_chain(self, members):
+        chain = next(self.ids)
+        self.members[chain] = members
+        self.assign(members, chain)
+        self.index(chain)
+
+    def assign(self, line_ids, chain):
+        """Records the lines as part of the chain, which changed"""
+        if len(self.chain_of) < self.lines.next_id:
+            self.chain_of.extend([NONE] * (self.lines.next_id - len(self.chain_of)))
+        for line_id in line_ids:
+            self.chain_of[line_id] = chain
+        self.versions[chain] = next(self.clock)
+
+    def index(self, chain):
+        """Registers the ends of an open chain, unless other chains have them"""
+        if chain in self.closed:
+            return
+        lines = self.lines
+        first, last = self.members[chain][0], self.members[chain][-1]
+        ink = lines.inks[first]
+        head, tail = (ink, lines.x1[first], lines.y1[first]), (ink, lines.x2[last], lines.y2[last])
+        self.heads.setdefault(head, chain)
+        self.tails.setdefault(tail, chain)
+        self.ends[chain] = (head, tail)
+
+    def unindex(self, chain):
+        """Unregisters the ends of a chain, before its lines change (they may already be gone from the track)"""
+        if chain not in self.ends:
+            return
+        head, tail = self.ends.pop(chain)
+        if self.heads.get(head) == chain:
+            del self.heads[head]
+        if self.tails.get(tail) == chain:
+            del self.tails[tail]
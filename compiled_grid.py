@@ -0,0 +1,60 @@
+""" In this module:
+Class CompiledGrid
+
+Read-only copy of the solid lines of the grid, for when the track cannot change (while the rider plays).
+"""
+
+from array import array
+from bisect import bisect_left
+
+from geometry import Line
+from grid import Grid
+
+
+class CompiledGrid:
+    """The solid cells of a Grid, packed in flat arrays (CSR layout):
+    keys: sorted cell keys, each one the column and row of a cell packed in a single integer
+    offsets: the lines of the cell keys[i] are line_ids[offsets[i]:offsets[i + 1]]
+    line_ids: IDs of the lines of all the cells, one cell after the other, in ID order within each cell
+    Lookups always return lines in the same order, and read a few contiguous arrays instead of dicts of sets.
+    Endpoints are read from the LineStore of the track, already in contiguous arrays.
+    Nothing here is updated: the track drops it as soon as it is edited (see Track.freeze)"""
+    def __init__(self, grid: Grid):
+        self.grid = grid
+        self.spacing = grid.spacing
+        cells = sorted((self.pack(cell), line_ids) for cell, line_ids in grid.solids.items())
+        self.keys = array('q', [key for key, _ in cells])
+        self.offsets = array('q', [0])
+        self.line_ids = array('q')
+        for _, line_ids in cells:
+            self.line_ids.extend(sorted(line_ids))
+            self.offsets.append(len(self.line_ids))
+
+    def __repr__(self):
+        return f'CompiledGrid({len(self.keys)} cells, {len(self.line_ids)} entries)'
+
+    def pack(self, cell):
+        """Single integer key of a cell, ordered by column then row"""
+        x, y = cell
+        return (x // self.spacing << 32) + y // self.spacing
+
+    def solid_lines_in(self, cell):
+        """returns the IDs of the solid lines of the cell, in ID order"""
+        key = self.pack(cell)
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return ()
+        return self.line_ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def grid_floor(self, x):
+        return self.grid.grid_floor(x)
+
+    def get_solid_lines(self, pnt, queried_cells=None):
+        """returns the IDs of the solid lines that exist in the same cells as the point, in ID order
+        queried_cells: if given, a set the cells looked up are added to"""
+        cells = list(self.grid.get_grid_cells(Line(pnt.r0, pnt.r)))
+        if queried_cells is not None:
+            queried_cells.update(cells)
+        if len(cells) == 1:
+            return self.solid_lines_in(cells[0])
+        return sorted({line_id for cell in cells for line_id in self.solid_lines_in(cell)})
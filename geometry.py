@@ -1,10 +1,12 @@
 
 
 import math
+from array import array
 
 
 class Point:
     """points have position and velocity implied by previous position"""
+    __slots__ = ('r', 'r0')
     def __init__(self, *args):
         x, y = args[0], args[1]
         self.r = Vector(x, y)  # current position
@@ -13,9 +15,75 @@ class Point:
     def __repr__(self):
         return "Point" + str((self.r, self.r0))
 
+    def r_into(self, vector):
+        """copies the position into an existing Vector"""
+        return vector.set(self.r.x, self.r.y)
+
+class PointArray:
+    """Many points stored as contiguous arrays (struct of arrays) instead of Point objects:
+    x, y: current positions, x0, y0: positions one frame before, mass: how much inertia is kept"""
+    def __init__(self, coords, masses):
+        self.x = array('d', (c[0] for c in coords))
+        self.y = array('d', (c[1] for c in coords))
+        self.x0 = array('d', self.x)
+        self.y0 = array('d', self.y)
+        self.mass = array('d', masses)
+
+    def __len__(self):
+        return len(self.x)
+
+    def __repr__(self):
+        return f'PointArray({len(self)} points)'
+
+    def extend(self, coords, masses):
+        """Appends points at rest, returns the index of the first one"""
+        offset = len(self)
+        self.x.extend(c[0] for c in coords)
+        self.y.extend(c[1] for c in coords)
+        self.x0.extend(self.x[offset:])
+        self.y0.extend(self.y[offset:])
+        self.mass.extend(masses)
+        return offset
+
+    def views(self, start=0, stop=None):
+        """Point-style objects reading and writing into the arrays"""
+        return [PointView(self, i) for i in range(start, len(self) if stop is None else stop)]
+
+class PointView:
+    """Point-style access (r, r0) to one entry of a PointArray"""
+    __slots__ = ('array', 'i')
+    def __init__(self, point_array, i):
+        self.array = point_array
+        self.i = i
+
+    def __repr__(self):
+        return "Point" + str((self.r, self.r0))
+
+    @property
+    def r(self):
+        return Vector(self.array.x[self.i], self.array.y[self.i])
+
+    @r.setter
+    def r(self, value):
+        self.array.x[self.i] = value.x
+        self.array.y[self.i] = value.y
+
+    def r_into(self, vector):
+        """reads the position into an existing Vector, instead of building one as r does"""
+        return vector.set(self.array.x[self.i], self.array.y[self.i])
+
+    @property
+    def r0(self):
+        return Vector(self.array.x0[self.i], self.array.y0[self.i])
+
+    @r0.setter
+    def r0(self, value):
+        self.array.x0[self.i] = value.x
+        self.array.y0[self.i] = value.y
+
 class Line:
     """lines are defined by two points, p1 and p2"""
-    #   __slots__ = ('r1', 'r2') for optimization?
+    __slots__ = ('r1', 'r2')
     def __init__(self, r1, r2):
         if isinstance(r1, Vector) and isinstance(r2, Vector):
             self.r1 = r1
@@ -35,28 +103,54 @@ class Line:
         return a, b, c
 
 class SolidLine(Line):
-    """collidable lines"""
-    def __init__(self, r1, r2, ink):
+    """collidable lines
+    Lines of a track are not kept as SolidLine objects: the LineStore keeps their coordinates in arrays
+    (with the cached collision geometry), and hands out SolidLine objects on demand, equal by ID"""
+    __slots__ = ('ink', 'id')
+
+    def __init__(self, r1, r2, ink, id=None):
         super(SolidLine, self).__init__(r1, r2)
         #       self.dir = (self.r2-self.r1).normalize() #direction the line points in
         #normal to line, 90 degrees ccw (to the left). DARN YOU FLIPPED COORDINATES
         #       self.norm = vector(self.dir.y, -self.dir.x)
         self.ink = ink
+        self.id = id  # stable ID, given by the LineStore of the track
 
     def __repr__(self):
-        return 'SolidLine' + str((self.r1, self.r2, self.ink.name))
+        return 'SolidLine' + str((self.id, self.r1, self.r2, self.ink.name))
+
+    def __eq__(self, other):
+        if self.id is None or not isinstance(other, SolidLine):
+            return self is other
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id) if self.id is not None else id(self)
+
+    def __getstate__(self):
+        return {'r1': self.r1, 'r2': self.r2, 'ink': self.ink, 'id': self.id}
+
+    def __setstate__(self, state):
+        self.r1, self.r2 = state['r1'], state['r2']
+        self.ink = state['ink']
+        self.id = state.get('id')  # lines saved before IDs existed get one when added to a track
 
 class Vector:
-    #   __slots__ = ('x', 'y')  #slots for optimization...?
-    def __init__(self, x, y:float=0):
-        if type(x) == tuple:
-            x, y = x[0], x[1]
-        self.x = float(x)
-        self.y = float(y)
+    __slots__ = ('x', 'y')
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
 
     def __repr__(self):
         return 'Vector' + str((self.x, self.y))
 
+    def __reduce__(self):
+        return Vector, (self.x, self.y)
+
+    def __setstate__(self, state):
+        """Vectors pickled before __slots__ carry their coordinates in a dict"""
+        self.x, self.y = state['x'], state['y']
+
     #vector addition/subtraction
     def __add__(self, other):
         return Vector(self.x + other.x, self.y + other.y)
@@ -89,18 +183,30 @@ class Vector:
         self.y *= other
         return self
 
-    def __idiv__(self, other):
+    def __itruediv__(self, other):
         self.x /= other
         self.y /= other
         return self
 
+    def set(self, x, y):
+        """in-place assignment, to reuse a Vector instead of building a new one"""
+        self.x = x
+        self.y = y
+        return self
+
+    def iadd_scaled(self, other, factor):
+        """in-place self += other * factor, without the intermediate Vector"""
+        self.x += other.x * factor
+        self.y += other.y * factor
+        return self
+
     def magnitude2(self):
         """the square of the magnitude of this vector"""
-        return distance2((self.x, self.y), (0, 0))
+        return self.x ** 2 + self.y ** 2
 
     def magnitude(self):
         """magnitude of this vector"""
-        return distance((self.x, self.y), (0, 0))
+        return (self.x ** 2 + self.y ** 2) ** 0.5
 
     def normalize(self):
         """unit vector. same direction but with a magnitude of 1"""
@@ -1,117 +1,290 @@
 
 
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
 from tool_helpers import Ink
 from geometry import Line
+from line_store import INK_CODES, FREE
 
 class Grid:
-    def __init__(self, track):
+    """Lines of the track by the cells they go through, on several levels of cell sizes.
+    Level 0 (solids and scenery) is the one physics looks lines up in.
+    Coarser levels serve viewport and radius queries: a query reads the finest level on which the box is
+    covered by at most max_cells cells, so that zoomed out views do not go through thousands of small cells.
+    A coarse cell holds the cells of the level below that have lines, not the IDs of the lines: from there the
+    query goes down to the lines of level 0, and the coarser levels take little memory.
+    spacings: size of the cells of each level, from the finest. Each one is a power of two times the first"""
+    def __init__(self, track, spacings=(50, 200, 800, 3200), max_cells: int = 256):
         self.track = track
-        self.spacing = 50
-        self.solids = dict()
+        self.spacing = spacings[0]
+        self.solids = dict()  # cell -> set of line IDs
         self.scenery = dict()
+        self.level_spacings = tuple(spacings)
+        self.coarse_levels = [dict() for _ in spacings[1:]]  # cell -> set of the cells with lines of the level below
+        self.max_cells = max_cells
+
+    def reset_grid(self, workers: int = None, chunk_size: int = 50000):
+        """Indexes all the lines of the track from scratch, in one pass over the coordinate arrays.
+        workers: if given, the lines are split in chunks whose cells are found in that many processes.
+        Chunks are copied into arrays, as views on a track file cannot be sent to another process"""
+        lines = self.track.lines
+        if workers is None:
+            solids, scenery = cells_of_lines(self.spacing, 0, lines.x1, lines.y1, lines.x2, lines.y2, lines.inks)
+        else:
+            solids, scenery = defaultdict(set), defaultdict(set)
+            chunks = [
+                (self.spacing, start, *(array(typecode, coords[start:start + chunk_size].tobytes())
+                                        for typecode, coords in zip('ddddb', (lines.x1, lines.y1, lines.x2,
+                                                                              lines.y2, lines.inks))))
+                for start in range(0, lines.next_id, chunk_size)
+            ]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for chunk_solids, chunk_scenery in pool.map(cells_of_lines, *zip(*chunks)):
+                    for grid, chunk_grid in ((solids, chunk_solids), (scenery, chunk_scenery)):
+                        for cell, line_ids in chunk_grid.items():
+                            grid[cell].update(line_ids)
+        self.load_cells(dict(solids), dict(scenery))
+
+    def load_cells(self, solids, scenery):
+        """Takes the given cells of level 0 (cell -> set of line IDs), computed beforehand,
+        and builds the coarser levels from them"""
+        self.solids, self.scenery = solids, scenery
+        self.coarse_levels = self.coarse_levels_of(solids, scenery)
+
+    def add_cells(self, solids, scenery):
+        """Adds cells of level 0 that are not in the grid yet, like the cells of a tile (see TileCache),
+        and the cells to the coarser levels"""
+        self.solids.update(solids)
+        self.scenery.update(scenery)
+        for grid, new_cells in zip(self.coarse_levels, self.coarse_levels_of(solids, scenery)):
+            for cell, finer_cells in new_cells.items():
+                grid.setdefault(cell, set()).update(finer_cells)
+
+    def remove_cells(self, solid_cells, scenery_cells):
+        """Drops the given cells of level 0, and the coarse cells containing them.
+        The cells must make whole cells of every level, like those of a tile"""
+        for grid, cells in ((self.solids, solid_cells), (self.scenery, scenery_cells)):
+            for cell in cells:
+                grid.pop(cell, None)
+        cells = set(solid_cells) | set(scenery_cells)
+        for grid, spacing in zip(self.coarse_levels, self.level_spacings[1:]):
+            for cell in coarse_cells(cells, spacing):
+                grid.pop(cell, None)
+
+    def coarse_levels_of(self, solids, scenery):
+        """Cells of the coarser levels made of the given cells of level 0"""
+        levels = []
+        finer_cells = set(solids) | set(scenery)
+        for spacing in self.level_spacings[1:]:
+            grid = defaultdict(set)
+            for cell in finer_cells:
+                x, y = cell
+                grid[x - x % spacing, y - y % spacing].add(cell)
+            levels.append(dict(grid))
+            finer_cells = grid.keys()
+        return levels
 
-    def reset_grid(self):
-        for line in self.track.lines:
-            self.add_to_grid(line)
+    def register(self, cells):
+        """Adds cells of level 0 to the coarse cells containing them, on every level"""
+        for grid, spacing in zip(self.coarse_levels, self.level_spacings[1:]):
+            coarse = set()
+            for cell in cells:
+                x, y = cell
+                parent = x - x % spacing, y - y % spacing
+                grid.setdefault(parent, set()).add(cell)
+                coarse.add(parent)
+            cells = coarse
+
+    def unregister(self, cells):
+        """Removes the cells of level 0 left without lines from the coarse cells, and the coarse cells left empty"""
+        cells = {cell for cell in cells if cell not in self.solids and cell not in self.scenery}
+        for grid, spacing in zip(self.coarse_levels, self.level_spacings[1:]):
+            emptied = set()
+            for cell in cells:
+                x, y = cell
+                parent = x - x % spacing, y - y % spacing
+                finer_cells = grid[parent]
+                finer_cells.remove(cell)
+                if len(finer_cells) == 0:
+                    grid.pop(parent)
+                    emptied.add(parent)
+            cells = emptied
 
     def add_to_grid(self, line):
-        cells = self.get_grid_cells(line)
+        cells = list(self.get_grid_cells(line))
         if line.ink == Ink.Scene:
             grid = self.scenery
         else:
             grid = self.solids
         for cell in cells:
-            lines = grid.get(cell, set())
-            lines |= {line}
-            grid[cell] = lines
+            grid.setdefault(cell, set()).add(line.id)
+        self.register(cells)
+
+    def add_lines(self, lines):
+        """add_to_grid on many lines at once: their cells are gathered first, then each cell is updated once"""
+        for grid, cells in self.cells_of(lines):
+            for cell, line_ids in cells.items():
+                grid.setdefault(cell, set()).update(line_ids)
+            self.register(cells)
+
+    def remove_lines(self, lines):
+        """remove_from_grid on many lines at once"""
+        emptied = []
+        for grid, cells in self.cells_of(lines):
+            for cell, line_ids in cells.items():
+                remaining = grid[cell]
+                remaining.difference_update(line_ids)
+                if len(remaining) == 0:
+                    grid.pop(cell)
+                    emptied.append(cell)
+        self.unregister(emptied)
+
+    def cells_of(self, lines):
+        """The cells of level 0 of the lines, as pairs (solids or scenery of the grid, cell -> IDs of the lines in it)"""
+        solids, scenery = defaultdict(set), defaultdict(set)
+        for line in lines:
+            grid = scenery if line.ink == Ink.Scene else solids
+            for cell in self.get_grid_cells(line):
+                grid[cell].add(line.id)
+        return [(self.solids, solids), (self.scenery, scenery)]
 
     def get_grid_cells(self, line: Line):
-        """returns a list of the cells the line exists in"""
-        firstCell = self.grid_pos(line.r1)
-        lastCell = self.grid_pos(line.r2)
-        if firstCell[0] > lastCell[0]:  # going in negative x direction MAKES BUGS
-            firstCell, lastCell = lastCell, firstCell
-        cells = [firstCell]
-        gridInts = self.get_grid_ints(line, firstCell, lastCell)
-        cell = firstCell
-        for x in sorted(gridInts):  # ordered by which cell the line enters
-            dcor = gridInts[x]
-            cell = cell[0] + dcor[0], cell[1] + dcor[1]
-            cells += [cell]
-        #   if lastCell not in cells:
-        #       cells += [lastCell]
-        return cells
-
-    def grid_in_screen(self, canvas_topleft, canvas_bottomright):
-        """returns a list of visible cells.
-        A cell is defined by its top-right coordinates (and spacing)"""
-        topLeft = self.grid_pos(canvas_topleft)
-        bottomRight = self.grid_pos(canvas_bottomright)
-        cols = range(topLeft[0], bottomRight[0] + self.spacing, self.spacing)
-        rows = range(topLeft[1], bottomRight[1] + self.spacing, self.spacing)
-        cells = [(x, y) for x in cols for y in rows]
-        return cells
+        """yields the cells the line goes through, from r1 to r2, each one once (see grid_cells)"""
+        return grid_cells(line.r1.x, line.r1.y, line.r2.x, line.r2.y, self.spacing)
 
     def remove_from_grid(self, line):
         """removes the line in the cells the line exists in"""
-        removedCells = self.get_grid_cells(line)  # list of cell positions
+        removedCells = list(self.get_grid_cells(line))  # list of cell positions
         if line.ink == Ink.Scene:
             grid = self.scenery
         else:
             grid = self.solids
         for gPos in removedCells:
             cell = grid[gPos]
-            # SET OF LINES, REMEMBER?
-            cell.remove(line)
+            # SET OF LINE IDS, REMEMBER?
+            cell.remove(line.id)
             if len(cell) == 0:  # get rid of the cell entirely if no lines
                 grid.pop(gPos)
+        self.unregister(removedCells)
 
-    def grid_neighbors(self, pos):
-        """returns a list of the positions of the cells at and around the pos"""
-        cells = {}
-        x, y = self.grid_pos(pos)
-        g = self.spacing
-        return [(x, y), (x + g, y), (x + g, y + g), (x, y + g), (x - g, y + g),
-                (x - g, y), (x - g, y - g), (x, y - g), (x + g, y - g)]
+    def get_lines_in_box(self, topleft, bottomright):
+        """returns the set of IDs of the lines of any ink in the cells covering the box,
+        read from the finest level where there are at most max_cells of them (or the coarsest one),
+        then down to the cells of level 0 with lines in them"""
+        for level, g in enumerate(self.level_spacings):
+            left, top = self.grid_floor(topleft.x, g), self.grid_floor(topleft.y, g)
+            right, bottom = self.grid_floor(bottomright.x, g), self.grid_floor(bottomright.y, g)
+            if ((right - left) // g + 1) * ((bottom - top) // g + 1) <= self.max_cells:
+                break
+        cells = [(x, y) for x in range(left, right + g, g) for y in range(top, bottom + g, g)]
+        for grid in reversed(self.coarse_levels[:level]):
+            cells = [finer_cell for cell in cells for finer_cell in grid.get(cell, ())]
+        line_ids = set()
+        for cell in cells:
+            line_ids.update(self.solids.get(cell, ()))
+            line_ids.update(self.scenery.get(cell, ()))
+        return line_ids
 
     def grid_pos(self, pnt):
         return self.grid_floor(pnt.x), self.grid_floor(pnt.y)
 
-    def grid_floor(self, x):
-        return int(x - x % self.spacing)
-
-    def get_grid_ints(self, line, firstCell, lastCell):
-        a, b, c = line.linear_equation()
-        dx = dy = self.spacing  # is >0
-        if lastCell[1] < firstCell[1]:  # y is decreasing
-            dy *= -1
-        gridInts = {}
-        xInc, yInc = (dx, 0), (0, dy)
-
-        # normally, I would just use x = (c-b*y)/a
-        if b == 0:  # a might be 0 so SWAP VALUES
-            b, a = a, b
-            yInc, xInc = xInc, yInc
-            dy, dx = dx, dy
-            firstCell = firstCell[1], firstCell[0]
-            lastCell = lastCell[1], lastCell[0]
-
-        for x in range(firstCell[0], lastCell[0], dx):  # vertical line intersections, exclude 0th line
-            x += dx
-            gridInts[x] = xInc
-
-        for y in range(firstCell[1], lastCell[1], dy):  # horizontal line intersections, exclude 0th line
-            if dy > 0:
-                y += dy
-            x = (c - b * y) / a
-            gridInts[x] = yInc
-        return gridInts
-
-    def get_solid_lines(self, pnt):
-        """returns a set of solid lines that exist in the same cells as the point"""
+    def grid_floor(self, x, spacing: int = None):
+        spacing = self.spacing if spacing is None else spacing
+        return int(x - x % spacing)
+
+    def solid_lines_in(self, cell):
+        """returns the IDs of the solid lines of the cell"""
+        return self.solids.get(cell, ())
+
+    def get_solid_lines(self, pnt, queried_cells=None):
+        """returns the set of IDs of the solid lines that exist in the same cells as the point
+        queried_cells: if given, a set the cells looked up are added to"""
         vLine = Line(pnt.r0, pnt.r)
-        return {
-            item
-            for cell in self.get_grid_cells(vLine)
-            for item in list(self.solids.get(cell, []))
-        }
+        line_ids = set()
+        for cell in self.get_grid_cells(vLine):
+            if queried_cells is not None:
+                queried_cells.add(cell)
+            line_ids.update(self.solids.get(cell, ()))
+        return line_ids
+
+
+def grid_cells(x1, y1, x2, y2, g):
+    """yields the cells of size g the line from (x1, y1) to (x2, y2) goes through, in order, each one once.
+    Walks the grid crossing by crossing (Amanatides & Woo): the next cell is on the side of whichever
+    grid line, vertical or horizontal, the line crosses first. Where it goes exactly through a corner,
+    both cells touching the corner are yielded too (supercover). The position of each crossing is computed from
+    its grid line rather than summed step by step, so that rounding does not hide a corner"""
+    cell_x, cell_y = int(x1 - x1 % g), int(y1 - y1 % g)
+    yield cell_x, cell_y
+    crossings_x = abs(int(x2 - x2 % g) - cell_x) // g  # number of vertical grid lines crossed
+    crossings_y = abs(int(y2 - y2 % g) - cell_y) // g
+    if crossings_x == crossings_y == 0:
+        return
+
+    # t: position along the line, from 0 at r1 to 1 at r2
+    dx, dy = x2 - x1, y2 - y1
+    step_x, step_y = (g if dx > 0 else -g), (g if dy > 0 else -g)
+    grid_x = cell_x + g if dx > 0 else cell_x  # next vertical grid line crossed
+    grid_y = cell_y + g if dy > 0 else cell_y
+    if crossings_x > 0:
+        next_t_x = (grid_x - x1) / dx
+    if crossings_y > 0:
+        next_t_y = (grid_y - y1) / dy
+
+    while crossings_x > 0 or crossings_y > 0:
+        if crossings_y == 0 or (crossings_x > 0 and next_t_x < next_t_y):
+            cell_x += step_x
+            grid_x += step_x
+            next_t_x = (grid_x - x1) / dx
+            crossings_x -= 1
+        elif crossings_x == 0 or next_t_y < next_t_x:
+            cell_y += step_y
+            grid_y += step_y
+            next_t_y = (grid_y - y1) / dy
+            crossings_y -= 1
+        else:  # through a corner
+            yield cell_x + step_x, cell_y
+            yield cell_x, cell_y + step_y
+            cell_x += step_x
+            cell_y += step_y
+            grid_x += step_x
+            grid_y += step_y
+            next_t_x = (grid_x - x1) / dx
+            next_t_y = (grid_y - y1) / dy
+            crossings_x -= 1
+            crossings_y -= 1
+        yield cell_x, cell_y
+
+
+def cells_of_lines(g, start, x1, y1, x2, y2, inks):
+    """Cells of size g of many lines at once, from their coordinate arrays. The lines are those with IDs
+    from start on: x1[k] is the coordinate of line start + k. Free IDs (see LineStore) are skipped.
+    Returns the cells of the solid lines and those of the scenery lines, as dicts cell -> set of line IDs"""
+    scene = INK_CODES[Ink.Scene]
+    solids, scenery = defaultdict(set), defaultdict(set)
+    cells_x1, cells_y1 = [int(x - x % g) for x in x1], [int(y - y % g) for y in y1]
+    cells_x2, cells_y2 = [int(x - x % g) for x in x2], [int(y - y % g) for y in y2]
+
+    crossing = []
+    for line_id, ink, cell, last_cell in zip(range(start, start + len(inks)), inks,
+                                             zip(cells_x1, cells_y1), zip(cells_x2, cells_y2)):
+        if ink == FREE:
+            continue
+        if cell == last_cell:  # most lines are within a single cell
+            (scenery if ink == scene else solids)[cell].add(line_id)
+        else:
+            crossing.append(line_id - start)
+
+    for k in crossing:
+        grid = scenery if inks[k] == scene else solids
+        for cell in grid_cells(x1[k], y1[k], x2[k], y2[k], g):
+            grid[cell].add(start + k)
+    return solids, scenery
+
+
+def coarse_cells(cells, spacing):
+    """The cells of size spacing containing the given cells of level 0, each one once.
+    Cells of coarser levels are made of whole cells of level 0, so these are the ones the line goes through"""
+    return {(x - x % spacing, y - y % spacing) for x, y in cells}
@@ -0,0 +1,88 @@
+""" In this module:
+Class History
+"""
+
+from collections import deque
+
+LINE_BYTES = 250  # a SolidLine and its two Vectors
+ID_BYTES = 40  # a line ID and its slot in the list
+ENTRY_BYTES = 200  # the entry and its lists
+
+
+class History:
+    """Undo and redo stacks of the edits of a track.
+    An entry is a list of actions (objects, command): command(objects, undo=True) (or redo=True) reverts
+    the action, and records the opposite one. Objects are lists, so that commands edit in bulk (see Track.add_lines).
+    The edits made during a transaction (a pencil stroke, an eraser drag) make a single entry, where consecutive
+    actions of the same command are merged: undoing a stroke is one bulk edit.
+    The stacks are deques. Once the entries of both take more than memory_cap bytes (an estimate),
+    the oldest undo entries are dropped, then the oldest redo ones"""
+    def __init__(self, memory_cap: int = 16 * 2 ** 20):
+        self.undo_stack = deque()  # (entry, bytes), oldest first
+        self.redo_stack = deque()
+        self.memory_cap = memory_cap
+        self.memory = 0
+        self.transaction = None  # entry being gathered, see begin()
+
+    def __repr__(self):
+        return (f'History({len(self.undo_stack)} undo and {len(self.redo_stack)} redo entries, '
+                f'{self.memory / 2 ** 20:.1f} MB)')
+
+    def begin(self):
+        """Starts gathering the actions recorded into one entry, until commit()"""
+        self.commit()
+        self.transaction = []
+
+    def commit(self, undo=False, redo=False):
+        """Records the actions gathered since begin() as one entry, if any"""
+        entry, self.transaction = self.transaction, None
+        if entry:
+            self.push(entry, undo, redo)
+
+    def record(self, action, undo=False, redo=False):
+        """Records an action: in the current transaction if any, as an entry of its own otherwise"""
+        if self.transaction is None:
+            self.push([action], undo, redo)
+            return
+        objects, command = action
+        if self.transaction and self.transaction[-1][1] == command:
+            self.transaction[-1][0].extend(objects)
+        else:
+            self.transaction.append((list(objects), command))
+
+    def push(self, entry, undo=False, redo=False):
+        """Undone entries go on the redo stack, new and redone ones on the undo stack"""
+        size = entry_memory(entry)
+        (self.redo_stack if undo else self.undo_stack).append((entry, size))
+        self.memory += size
+        for stack in (self.undo_stack, self.redo_stack):
+            while self.memory > self.memory_cap and len(stack) > (stack is self.undo_stack):  # keep the last edit
+                self.memory -= stack.popleft()[1]
+
+    def undo(self):
+        self.commit()  # an edit still in progress comes first
+        if self.undo_stack:
+            self.apply(self.pop(self.undo_stack), undo=True)
+
+    def redo(self):
+        self.commit()
+        if self.redo_stack:
+            self.apply(self.pop(self.redo_stack), redo=True)
+
+    def pop(self, stack):
+        entry, size = stack.pop()
+        self.memory -= size
+        return entry
+
+    def apply(self, entry, undo=False, redo=False):
+        """Reverts the actions of the entry, last first, and records their opposites as one entry"""
+        self.transaction = []
+        for objects, command in reversed(entry):
+            command(objects, undo=undo, redo=redo)
+        self.commit(undo, redo)
+
+
+def entry_memory(entry):
+    """Estimated bytes of an entry, from the lines and IDs it holds"""
+    return ENTRY_BYTES + sum(ID_BYTES if isinstance(obj, int) else LINE_BYTES
+                             for objects, _ in entry for obj in objects)
@@ -0,0 +1,200 @@
+""" In this module:
+Class Journal
+
+Edits of a track appended to a file next to its track file, so that saving does not write the whole track again
+and edits survive a crash. The journal of savedLines/name is savedLines/name.journal:
+    header: magic b'LRJN', version (uint16), 2 bytes of padding
+    records: operation (int8: ADD, REMOVE or SAVE), ink code (int8, see line_store.INKS), line ID (int64),
+        x1, y1, x2, y2 (doubles)
+The saved track is the track file with the records before the last SAVE replayed in order; the records after it
+are edits that were never saved. A record sets the whole state of a line ID, so replaying records that the track
+file already has changes nothing.
+"""
+
+import os
+import queue
+import struct
+import threading
+from pathlib import Path
+
+import track_file
+from geometry import SolidLine, Vector
+from line_store import INKS, INK_CODES
+from track import Track
+
+SUFFIX = '.journal'
+MAGIC = b'LRJN'
+VERSION = 1
+HEADER = struct.Struct('<4sHxx')
+RECORD = struct.Struct('<bbqdddd')
+ADD, REMOVE, SAVE = 1, 0, 2
+SAVE_RECORD = RECORD.pack(SAVE, 0, 0, 0, 0, 0, 0)
+
+
+class Journal:
+    """Writes the edits of a track to its journal, from a background thread: recording an edit only queues it.
+    save() marks everything recorded so far as saved, at the cost of the edits since the last save, and does not
+    wait for it either. Once compact_every saved records are in the journal, they are folded into the track file
+    (compaction), still in the background: the track file is written again, and the journal keeps the unsaved
+    records. A save queued behind a compaction is written after it, while the caller goes on.
+    keep_unsaved: keeps the unsaved records already in the journal (they were replayed, see App.recover),
+    otherwise they are dropped"""
+    def __init__(self, track: Track, path, compact_every: int = 5000, keep_unsaved: bool = False):
+        self.track = track
+        self.path = Path(path)
+        self.journal_path = journal_path(self.path)
+        self.compact_every = compact_every
+        if not keep_unsaved:
+            discard_unsaved(self.journal_path)
+        records, self.saved, saved_end = read(self.journal_path)
+        self.unsaved = len(records) - self.saved
+        if self.journal_path.exists():  # a record cut short by a crash would shift the next ones
+            os.truncate(self.journal_path, max(saved_end + self.unsaved * RECORD.size, HEADER.size))
+        self.error = None  # last error of the writer thread
+        self.file = None  # opened on the first record
+        self.queue = queue.Queue()  # (kind, value) items for the writer thread
+        self.thread = threading.Thread(target=self.run, name='journal', daemon=True)
+        self.thread.start()
+        track.edit_listeners.append(self.record)
+
+    def __repr__(self):
+        return f'Journal({self.journal_path}, {self.saved} saved and {self.unsaved} unsaved records)'
+
+    def record(self, line):
+        """Edit listener of the track: queues the line as added or removed"""
+        if line is None:  # the whole track changed: another journal takes over, see App.load_track
+            return
+        op = ADD if line in self.track.lines else REMOVE
+        self.queue.put(('record', RECORD.pack(op, INK_CODES[line.ink], line.id,
+                                              line.r1.x, line.r1.y, line.r2.x, line.r2.y)))
+
+    def save(self, saved=None):
+        """Marks the edits recorded so far as saved, once they are on disk. Returns right away
+        saved: called from the writer thread once the save is on disk or failed, with the error or None"""
+        self.queue.put(('save', saved))
+
+    def close(self, discard_unsaved_edits: bool = False):
+        """Stops recording, once the queued edits are written. The journal is removed if it has no records left"""
+        if self.record in self.track.edit_listeners:
+            self.track.edit_listeners.remove(self.record)
+        if self.thread.is_alive():
+            self.queue.put(('close', discard_unsaved_edits))
+            self.thread.join()
+
+    def run(self):
+        while True:
+            kind, value = self.queue.get()
+            try:
+                if kind == 'record':
+                    self.write(value)
+                    self.unsaved += 1
+                elif kind == 'save':
+                    self.write(SAVE_RECORD)
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                    self.saved += self.unsaved
+                    self.unsaved = 0
+                    self.error = None
+                    if value is not None:
+                        value(None)
+                    if self.saved >= self.compact_every:
+                        self.compact()
+                elif kind == 'close':
+                    if self.file is not None:
+                        self.file.close()
+                    if value:
+                        discard_unsaved(self.journal_path)
+                    elif self.journal_path.exists() and not read(self.journal_path)[0]:
+                        self.journal_path.unlink()
+                    return
+                if self.queue.empty() and self.file is not None:
+                    self.file.flush()
+            except Exception as error:
+                print(f'Error while writing the journal: {error}')
+                self.error = error
+                if kind == 'save' and value is not None:
+                    value(error)
+
+    def write(self, record):
+        if self.file is None:
+            new = not self.journal_path.exists()
+            self.file = open(self.journal_path, 'ab')
+            if new:
+                self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.file.write(record)
+
+    def compact(self):
+        """Folds the saved records into the track file, and keeps the others in the journal"""
+        self.file.close()
+        self.file = None
+        records, saved, _ = read(self.journal_path)
+        track = Track()
+        if self.path.exists():
+            track.import_(track_file.load_payload(self.path))
+        replay(track, records[:saved])
+        track_file.write(track, self.path, keep_ids=True)  # later records address lines by ID
+        # from here on, the journal replays onto the new track file as well as onto the old one
+        temp_path = self.journal_path.with_name(self.journal_path.name + '.tmp')
+        with open(temp_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION))
+            for record in records[saved:]:
+                file.write(RECORD.pack(*record))
+        os.replace(temp_path, self.journal_path)
+        self.saved = 0
+
+
+def journal_path(path):
+    """Journal of the track file at path"""
+    path = Path(path)
+    return path.with_name(path.name + SUFFIX)
+
+
+def track_path(path):
+    """Track file of the journal at path"""
+    path = Path(path)
+    return path.with_name(path.name[:-len(SUFFIX)])
+
+
+def read(path):
+    """Records of the journal at path, as tuples (operation, ink code, line ID, x1, y1, x2, y2), without SAVEs.
+    Returns them with the number of them that were saved, and the size of the file up to the last SAVE.
+    A record cut short by a crash is ignored"""
+    path = Path(path)
+    if not path.exists():
+        return [], 0, 0
+    data = path.read_bytes()
+    if len(data) < HEADER.size:
+        return [], 0, 0
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a journal')
+    if version > VERSION:
+        raise ValueError(f'{path} is a journal of version {version}, newer than this program (version {VERSION})')
+    records, saved, saved_end = [], 0, HEADER.size
+    end = HEADER.size + (len(data) - HEADER.size) // RECORD.size * RECORD.size
+    for offset in range(HEADER.size, end, RECORD.size):
+        record = RECORD.unpack_from(data, offset)
+        if record[0] == SAVE:
+            saved, saved_end = len(records), offset + RECORD.size
+        else:
+            records.append(record)
+    return records, saved, saved_end
+
+
+def discard_unsaved(path):
+    """Drops the unsaved records of the journal at path, and the journal itself if none is left"""
+    path = Path(path)
+    records, saved, saved_end = read(path)
+    if saved == 0:
+        path.unlink(missing_ok=True)
+    elif len(records) > saved:
+        os.truncate(path, saved_end)
+
+
+def replay(track: Track, records):
+    """Applies journaled edits to the track, in order"""
+    for op, ink, line_id, x1, y1, x2, y2 in records:
+        if line_id in track.lines:
+            track.remove_line(line_id)
+        if op == ADD:
+            track.add_line(SolidLine(Vector(x1, y1), Vector(x2, y2), INKS[ink], line_id))
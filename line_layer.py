@@ -0,0 +1,135 @@
+""" In this module:
+Class LineLayer
+"""
+
+import tkinter as tk
+
+from lod import LevelOfDetail
+from tool_helpers import Ink
+from viewport import Viewport
+
+RETAINED = 'retained'  # tag of the canvas items kept from one frame to the next, see UI.redraw_all
+LINE = 'line'  # tag of the items of track lines
+INK_TAGS = {Ink.Solid: 'solid', Ink.Acc: 'acc', Ink.Scene: 'scene'}
+
+
+class LineLayer:
+    """Canvas items of the track lines, kept from one frame to the next.
+    Connected lines make a single item, a polyline per chain (see Chains), keyed by chain ID.
+    Items are in screen coordinates for the view they were last updated for: when the camera pans or zooms,
+    Tk moves (and scales) all of them at once, instead of them being drawn again. Only chains entering the
+    viewport, or edited, get new items, and only those leaving it lose theirs. The lines in view come from a
+    Viewport, which keeps lines a margin beyond the canvas, so that small pans do not churn items at the edges.
+    Zoomed out, items are those of the simplified track instead (see update_lod), kept per cell.
+    Colours, which depend on the player being paused, and widths, which depend on zoom, are set on tags at once"""
+    def __init__(self, canvas: tk.Canvas):
+        self.canvas = canvas
+        self.items = dict()  # chain ID -> (version of the chain, canvas item)
+        self.band = None  # zoom band of the items, None for one item per chain
+        self.cells = dict()  # zoomed out: cell -> (geometry, items), see LevelOfDetail
+        self.view = None  # (cam x, cam y, zoom, center x, center y) the item coordinates are for
+        self.style = None  # (paused, width) the items are configured for
+        self.version = None  # version of the viewport the items are for
+        self.hidden = False  # while RasterLayer shows the lines
+
+    def __len__(self):
+        return len(self.items)
+
+    def line_edited(self, line):
+        """Edit listener of the track: edited chains are found by their version, at the next update"""
+        if line is None:  # the whole track changed
+            self.clear()
+
+    def clear(self):
+        self.canvas.delete(LINE)
+        self.items.clear()
+        self.cells.clear()
+        self.version = None
+
+    def update(self, viewport: Viewport, paused: bool, width: float):
+        """Brings the items in line with the track seen through the viewport (see Viewport.update)"""
+        if self.band is not None:
+            self.clear()
+            self.band = None
+        if self.items and viewport.view != self.view:
+            self.move_view(self.view, viewport.view)
+        self.view = viewport.view
+        if (paused, width) != self.style:
+            self.set_style(paused, width)
+        if viewport.version == self.version:
+            return  # same lines in view
+        self.version = viewport.version
+
+        chains = viewport.track.chains
+        visible = chains.chains_of(viewport.ids)
+        versions = chains.versions
+        stale = [chain for chain, (version, _) in self.items.items()
+                 if chain not in visible or versions.get(chain) != version]
+        if stale:
+            self.canvas.delete(*[self.items.pop(chain)[1] for chain in stale])
+        for chain in visible:
+            if chain not in self.items:
+                self.items[chain] = (versions[chain], self.create_polyline(chains.ink(chain), chains.coords(chain),
+                                                                           paused, width))
+
+    def update_lod(self, track, lod: LevelOfDetail, cam, zoom: float, center, paused: bool, width: float):
+        """Brings the items in line with the simplified track of the zoom band, seen from the camera.
+        Cells not built yet (see LevelOfDetail.update) show up in later frames"""
+        band = lod.band_of(zoom)
+        if band != self.band:
+            self.clear()
+            self.band = band
+        view = (cam.x, cam.y, zoom, center.x, center.y)
+        if self.cells and view != self.view:
+            self.move_view(self.view, view)
+        self.view = view
+        if (paused, width) != self.style:
+            self.set_style(paused, width)
+
+        built = lod.update(track, band, lod.cells_in_view(band, cam, zoom, center))
+        stale = [cell for cell, (geometry, _) in self.cells.items() if built.get(cell) is not geometry]
+        if stale:
+            self.canvas.delete(*[item for cell in stale for item in self.cells.pop(cell)[1]])
+        for cell, geometry in built.items():
+            if cell not in self.cells:
+                self.cells[cell] = (geometry, [self.create_polyline(ink, coords, paused, width)
+                                               for ink, coords in geometry])
+
+    def create_polyline(self, ink, coords, paused, width):
+        cam_x, cam_y, zoom, center_x, center_y = self.view
+        screen = list(coords)
+        screen[0::2] = [(x - cam_x) * zoom + center_x for x in coords[0::2]]
+        screen[1::2] = [(y - cam_y) * zoom + center_y for y in coords[1::2]]
+        fill, arrow = 'black', None
+        if paused and ink == Ink.Scene:
+            fill = 'green'
+        elif paused and ink == Ink.Acc:
+            fill, arrow = 'red', tk.LAST
+        return self.canvas.create_line(*screen, width=width, capstyle=tk.ROUND, joinstyle=tk.ROUND,
+                                       fill=fill, arrow=arrow, tags=(RETAINED, LINE, INK_TAGS[ink]))
+
+    def set_hidden(self, hidden: bool):
+        """Hides or shows the items, left as they are while hidden"""
+        if hidden != self.hidden:
+            self.canvas.itemconfigure(LINE, state=tk.HIDDEN if hidden else tk.NORMAL)
+            self.hidden = hidden
+
+    def move_view(self, old_view, new_view):
+        """Moves the items from the screen coordinates of the old view to those of the new one:
+        screen = (world - cam) * zoom + center, so new screen = (old screen - old center) * k + offset"""
+        cam_x, cam_y, zoom, center_x, center_y = old_view
+        new_cam_x, new_cam_y, new_zoom, new_center_x, new_center_y = new_view
+        if new_zoom != zoom:
+            k = new_zoom / zoom
+            self.canvas.scale(LINE, center_x, center_y, k, k)
+        dx = (cam_x - new_cam_x) * new_zoom + new_center_x - center_x
+        dy = (cam_y - new_cam_y) * new_zoom + new_center_y - center_y
+        if dx or dy:
+            self.canvas.move(LINE, dx, dy)
+
+    def set_style(self, paused, width):
+        self.canvas.itemconfigure(LINE, width=width)
+        self.canvas.itemconfigure(INK_TAGS[Ink.Scene], fill='green' if paused else 'black')
+        self.canvas.itemconfigure(INK_TAGS[Ink.Acc], fill='red' if paused else 'black',
+                                  arrow=tk.LAST if paused else tk.NONE)
+        self.style = (paused, width)
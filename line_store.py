@@ -0,0 +1,185 @@
+""" In this module:
+Class LineStore
+"""
+
+from array import array
+
+from geometry import SolidLine, Vector
+from tool_helpers import Ink
+
+INKS = tuple(Ink)  # the ink of a line is stored as its index in this tuple
+INK_CODES = {ink: code for code, ink in enumerate(INKS)}
+FREE = -1  # ink code of an ID without line: removed, or never used
+
+
+class LineStore:
+    """Lines of a track, keyed by stable integer IDs.
+    Coordinates live in contiguous arrays indexed by ID, together with the cached bounding box used by
+    collisions. No object is kept per line: SolidLine objects are built on demand.
+    A removed line only frees its slot, so that undo can bring it back with the same ID.
+    Adding, removing and checking membership are O(1); iteration follows ID order.
+    The endpoints and inks, and the boxes of a tiled file, may also be read-only views on a memory-mapped track file
+    (see from_arrays): they are copied into arrays of their own on the first edit"""
+    def __init__(self, lines=()):
+        self.x1, self.y1, self.x2, self.y2 = array('d'), array('d'), array('d'), array('d')
+        self.xmin, self.xmax, self.ymin, self.ymax = array('d'), array('d'), array('d'), array('d')
+        self.inks = array('b')
+        self.directions = dict()  # ID -> unit vector (x, y) of acceleration lines
+        self.count = 0
+        self.add_all(lines)
+
+    @classmethod
+    def from_arrays(cls, x1, y1, x2, y2, inks, boxes=None):
+        """Store over existing endpoint and ink arrays indexed by ID, used as they are (arrays or memoryviews).
+        The directions of acceleration lines are computed, and the bounding boxes too unless given
+        boxes: xmin, xmax, ymin, ymax arrays"""
+        store = cls()
+        store.x1, store.y1, store.x2, store.y2, store.inks = x1, y1, x2, y2, inks
+        store.count = sum(1 for ink in inks if ink != FREE)
+        if boxes is None:
+            store._compute_boxes()
+        else:
+            store.xmin, store.xmax, store.ymin, store.ymax = boxes
+        acc = INK_CODES[Ink.Acc]
+        for line_id in [line_id for line_id, ink in enumerate(inks) if ink == acc]:
+            store.directions[line_id] = store._direction(x1[line_id], y1[line_id], x2[line_id], y2[line_id])
+        return store
+
+    def __repr__(self):
+        return f'LineStore({len(self)} lines)'
+
+    def __getstate__(self):
+        """Views on a track file are pickled as arrays"""
+        return {name: array(value.format, value) if isinstance(value, memoryview) else value
+                for name, value in self.__dict__.items()}
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (self[line_id] for line_id in self.ids())
+
+    def __getitem__(self, line_id):
+        if line_id not in self:
+            raise KeyError(line_id)
+        return SolidLine(
+            Vector(self.x1[line_id], self.y1[line_id]), Vector(self.x2[line_id], self.y2[line_id]),
+            INKS[self.inks[line_id]], line_id
+        )
+
+    def __contains__(self, item):
+        """item is either a line ID or a line"""
+        line_id = item if isinstance(item, int) else item.id
+        return line_id is not None and 0 <= line_id < len(self.inks) and self.inks[line_id] != FREE
+
+    @property
+    def next_id(self):
+        return len(self.inks)
+
+    def ids(self):
+        return (line_id for line_id, ink in enumerate(self.inks) if ink != FREE)
+
+    def ink(self, line_id):
+        return INKS[self.inks[line_id]]
+
+    def add(self, line):
+        """Stores the line, and gives it an ID if it does not have one yet (a line keeps its ID on undo/redo)"""
+        self.own_arrays()
+        if line.id is None:
+            line.id = self.next_id
+        line_id = line.id
+        if line_id >= self.next_id:
+            self._grow(line_id + 1)
+        if self.inks[line_id] == FREE:
+            self.count += 1
+
+        x1, y1, x2, y2 = line.r1.x, line.r1.y, line.r2.x, line.r2.y
+        self.x1[line_id], self.y1[line_id], self.x2[line_id], self.y2[line_id] = x1, y1, x2, y2
+        self.xmin[line_id], self.xmax[line_id] = min(x1, x2), max(x1, x2)
+        self.ymin[line_id], self.ymax[line_id] = min(y1, y2), max(y1, y2)
+        self.inks[line_id] = INK_CODES[line.ink]
+        if line.ink == Ink.Acc:
+            self.directions[line_id] = self._direction(x1, y1, x2, y2)
+        return line_id
+
+    def add_all(self, lines):
+        """Stores many lines at once, like add on each line, but filling the arrays column by column"""
+        self.own_arrays()
+        lines = list(lines)
+        ids = [line.id for line in lines]
+        if None in ids:  # give IDs the way add would, one line after the other
+            next_id = self.next_id
+            for k, line in enumerate(lines):
+                if line.id is None:
+                    line.id = next_id
+                ids[k] = line.id
+                next_id = max(next_id, line.id + 1)
+        xs1, ys1 = [line.r1.x for line in lines], [line.r1.y for line in lines]
+        xs2, ys2 = [line.r2.x for line in lines], [line.r2.y for line in lines]
+        inks = [INK_CODES[line.ink] for line in lines]
+
+        if self.next_id == 0 and ids == list(range(len(ids))):  # new store, as when loading a track
+            self.x1, self.y1, self.x2, self.y2 = array('d', xs1), array('d', ys1), array('d', xs2), array('d', ys2)
+            self.inks = array('b', inks)
+            self.count = len(ids)
+            self._compute_boxes()
+        else:  # a few lines into a large store, as when undoing: only their boxes are computed
+            self._grow(max(ids, default=-1) + 1)
+            self.count += sum(1 for line_id in set(ids) if self.inks[line_id] == FREE)
+            for coords, column in zip((self.x1, self.y1, self.x2, self.y2, self.inks), (xs1, ys1, xs2, ys2, inks)):
+                for line_id, value in zip(ids, column):
+                    coords[line_id] = value
+            for line_id, ax, ay, bx, by in zip(ids, xs1, ys1, xs2, ys2):
+                self.xmin[line_id], self.xmax[line_id] = min(ax, bx), max(ax, bx)
+                self.ymin[line_id], self.ymax[line_id] = min(ay, by), max(ay, by)
+
+        acc = INK_CODES[Ink.Acc]
+        for line_id, ink, ax, ay, bx, by in zip(ids, inks, xs1, ys1, xs2, ys2):
+            if ink == acc:
+                self.directions[line_id] = self._direction(ax, ay, bx, by)
+
+    def _compute_boxes(self):
+        """Bounding boxes of all the lines: same as min() and max() on each one, but faster"""
+        x1, y1, x2, y2 = self.x1, self.y1, self.x2, self.y2
+        self.xmin = array('d', [b if b < a else a for a, b in zip(x1, x2)])
+        self.xmax = array('d', [b if b > a else a for a, b in zip(x1, x2)])
+        self.ymin = array('d', [b if b < a else a for a, b in zip(y1, y2)])
+        self.ymax = array('d', [b if b > a else a for a, b in zip(y1, y2)])
+
+    @staticmethod
+    def _direction(x1, y1, x2, y2):
+        """Unit vector from (x1, y1) to (x2, y2), as a tuple: same as (r2 - r1).normalize()"""
+        dx, dy = x2 - x1, y2 - y1
+        length = (dx ** 2 + dy ** 2) ** 0.5
+        return (dx / length, dy / length) if (dx, dy) != (0, 0) else (0, 0)
+
+    def remove(self, line_id):
+        self.own_arrays()
+        line = self[line_id]
+        self.inks[line_id] = FREE
+        self.directions.pop(line_id, None)
+        self.count -= 1
+        return line
+
+    def last(self):
+        """The line with the highest ID, None if there is none"""
+        for line_id in range(self.next_id - 1, -1, -1):
+            if self.inks[line_id] != FREE:
+                return self[line_id]
+        return None
+
+    def own_arrays(self):
+        """Copies views on a track file into arrays, before the first edit (or before the file is overwritten)"""
+        for name in ('x1', 'y1', 'x2', 'y2', 'xmin', 'xmax', 'ymin', 'ymax', 'inks'):
+            values = getattr(self, name)
+            if isinstance(values, memoryview):
+                setattr(self, name, array(values.format, values))
+
+    def _grow(self, size):
+        """Extends the arrays with free slots, up to the given number of IDs"""
+        missing = size - self.next_id
+        if missing <= 0:
+            return
+        for coords in (self.x1, self.y1, self.x2, self.y2, self.xmin, self.xmax, self.ymin, self.ymax):
+            coords.frombytes(bytes(coords.itemsize * missing))
+        self.inks.frombytes(bytes([FREE & 0xff]) * missing)
@@ -0,0 +1,154 @@
+""" In this module:
+Class LevelOfDetail
+"""
+
+import math
+import time
+from array import array
+
+from geometry import Vector
+from line_store import INKS
+
+
+class LevelOfDetail:
+    """Simplified geometry of the track, to draw it zoomed out (see LineLayer.update_lod).
+    Zooms below full_detail_zoom fall into bands: band b goes down to full_detail_zoom / 2 ** b. In a band,
+    tolerance is pixel_tolerance pixels at its lowest zoom. Connected segments of the same ink (each r2 the r1 of
+    the next, as pencil strokes are drawn) make chains, simplified with the Douglas-Peucker algorithm so that no
+    point moves by more than tolerance. Chains (single segments included) smaller than tolerance are culled.
+    Geometry is built per band and per cell, a square of cell_pixels to twice that on screen, and cached.
+    A cell owns the lines whose r1 is in it, and the lines spanning more than the cells around it that overlap it.
+    Edits drop the cells of the line in every band. Building is spread over frames: update builds the missing
+    cells in view for about budget seconds, nearest to the camera first"""
+    def __init__(self, full_detail_zoom: float = 0.5, pixel_tolerance: float = 0.5, cell_pixels: int = 256,
+                 budget: float = 0.03):
+        self.full_detail_zoom = full_detail_zoom
+        self.pixel_tolerance = pixel_tolerance
+        self.cell_pixels = cell_pixels
+        self.budget = budget
+        self.track = None
+        self.bands = dict()  # band -> {cell: geometry}, geometry being a list of (ink, array of x, y, x, y...)
+
+    def __repr__(self):
+        return f'LevelOfDetail({ {band: len(cells) for band, cells in self.bands.items()} } cells built per band)'
+
+    def band_of(self, zoom: float):
+        """Band of the zoom, None when lines are drawn one by one"""
+        if zoom >= self.full_detail_zoom:
+            return None
+        return max(1, math.ceil(math.log2(self.full_detail_zoom / zoom)))
+
+    def tolerance(self, band):
+        return self.pixel_tolerance * 2 ** band / self.full_detail_zoom
+
+    def cell_size(self, band):
+        return self.cell_pixels * 2 ** band / self.full_detail_zoom
+
+    def cells_in_view(self, band, cam, zoom: float, center):
+        """Cells that may own lines in view, nearest to the camera first"""
+        size = self.cell_size(band)
+        reach = center / zoom
+        x_min, y_min = cell_of(cam.x - reach.x, cam.y - reach.y, size)
+        x_max, y_max = cell_of(cam.x + reach.x, cam.y + reach.y, size)
+        x_cam, y_cam = cell_of(cam.x, cam.y, size)
+        cells = [(x, y) for x in range(x_min - 1, x_max + 2) for y in range(y_min - 1, y_max + 2)]
+        cells.sort(key=lambda cell: abs(cell[0] - x_cam) + abs(cell[1] - y_cam))
+        return cells
+
+    def update(self, track, band, cells):
+        """Builds the missing cells among these, within the time budget. Returns the built ones as {cell: geometry}"""
+        if track is not self.track:
+            self.bands.clear()
+            self.track = track
+        built = self.bands.setdefault(band, dict())
+        deadline = time.perf_counter() + self.budget
+        for cell in cells:
+            if cell not in built and time.perf_counter() < deadline:
+                built[cell] = self.build(band, cell)
+        return {cell: built[cell] for cell in cells if cell in built}
+
+    def build(self, band, cell):
+        """Simplified geometry of the lines owned by the cell"""
+        size = self.cell_size(band)
+        tolerance = self.tolerance(band)
+        lines = self.track.lines
+        x1, y1, x2, y2, inks = lines.x1, lines.y1, lines.x2, lines.y2, lines.inks
+        corner = Vector(cell[0] * size, cell[1] * size)
+        geometry, owned = [], []
+        for line_id in sorted(self.track.get_line_ids_between(corner, corner + Vector(size, size))):
+            start = cell_of(x1[line_id], y1[line_id], size)
+            end = cell_of(x2[line_id], y2[line_id], size)
+            if abs(end[0] - start[0]) > 1 or abs(end[1] - start[1]) > 1:  # long line, drawn by every cell it overlaps
+                geometry.append((INKS[inks[line_id]], array('d', (x1[line_id], y1[line_id], x2[line_id], y2[line_id]))))
+            elif start == cell:
+                owned.append(line_id)
+
+        starts = dict()  # (ink, x1, y1) -> IDs of the owned lines starting there
+        for line_id in owned:
+            starts.setdefault((inks[line_id], x1[line_id], y1[line_id]), []).append(line_id)
+        ends = {(inks[line_id], x2[line_id], y2[line_id]) for line_id in owned}
+        used = set()
+        # chains start at lines no other one ends at, then loops start anywhere
+        for line_id in sorted(owned, key=lambda line_id: (inks[line_id], x1[line_id], y1[line_id]) in ends):
+            if line_id in used:
+                continue
+            ink = inks[line_id]
+            points = [x1[line_id], y1[line_id]]
+            while line_id is not None:
+                used.add(line_id)
+                points += (x2[line_id], y2[line_id])
+                following = starts.get((ink, x2[line_id], y2[line_id]), ())
+                line_id = next((line_id for line_id in following if line_id not in used), None)
+            if max(points[0::2]) - min(points[0::2]) < tolerance and max(points[1::2]) - min(points[1::2]) < tolerance:
+                continue  # smaller than a pixel
+            geometry.append((INKS[ink], array('d', simplify(points, tolerance))))
+        return geometry
+
+    def line_edited(self, line):
+        """Edit listener of the track: drops the cells of the line"""
+        if line is None:  # the whole track changed
+            self.bands.clear()
+            return
+        for band, built in self.bands.items():
+            size = self.cell_size(band)
+            start = cell_of(line.r1.x, line.r1.y, size)
+            end = cell_of(line.r2.x, line.r2.y, size)
+            if abs(end[0] - start[0]) <= 1 and abs(end[1] - start[1]) <= 1:
+                built.pop(start, None)
+            else:
+                xs = range(min(start[0], end[0]), max(start[0], end[0]) + 1)
+                ys = range(min(start[1], end[1]), max(start[1], end[1]) + 1)
+                for cell in [cell for cell in built if cell[0] in xs and cell[1] in ys]:
+                    del built[cell]
+
+
+def cell_of(x, y, size):
+    return int(x // size), int(y // size)
+
+
+def simplify(points, tolerance):
+    """Douglas-Peucker simplification of a polyline given as [x0, y0, x1, y1...]:
+    keeps the points needed for no dropped point to be further than tolerance from the polyline"""
+    n = len(points) // 2
+    if n < 3:
+        return points
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    limit = tolerance * tolerance
+    pending = [(0, n - 1)]
+    while pending:
+        first, last = pending.pop()
+        ax, ay = points[2 * first], points[2 * first + 1]
+        dx, dy = points[2 * last] - ax, points[2 * last + 1] - ay
+        length = dx * dx + dy * dy
+        worst, farthest = limit, None
+        for k in range(first + 1, last):
+            px, py = points[2 * k] - ax, points[2 * k + 1] - ay
+            t = min(1, max(0, (px * dx + py * dy) / length)) if length else 0
+            px, py = px - t * dx, py - t * dy
+            if px * px + py * py > worst:
+                worst, farthest = px * px + py * py, k
+        if farthest is not None:
+            keep[farthest] = True
+            pending += [(first, farthest), (farthest, last)]
+    return [coord for k in range(n) if keep[k] for coord in (points[2 * k], points[2 * k + 1])]
@@ -1,8 +1,6 @@
 
 
 import time
-import os
-import pickle
 import copy
 from pathlib import Path
 
@@ -11,37 +9,57 @@ from player import Player
 from world import World
 from track import Track
 from rider import Rider
+from simulation import Simulation
+import track_file
+import journal
+from history import History
 from tools import ToolManager
 
 class App:
     def __init__(self):
-        self.world = World(app=self)
+        self.world = World()
         self.player = Player(app=self)
         self.tm = ToolManager(self)
         self.ui = UI(app=self)
         self.player.set_panpos()
         self.track = Track(app=self)
-        self.rider = Rider(self.track.startPoint)
+        self.track.edit_listeners.append(self.ui.line_layer.line_edited)
+        self.track.edit_listeners.append(self.ui.viewport.line_edited)
+        self.track.edit_listeners.append(self.ui.lod.line_edited)
+        self.track.edit_listeners.append(self.ui.raster.line_edited)
+        self.simulation = Simulation(self.track, Rider(self.track.startPoint), self.world)
         self.start_session()
 
         self.dir_tracks = Path('./savedLines/')
         self.dir_tracks.mkdir(exist_ok=True)
+        self.journal = journal.Journal(self.track, self.dir_tracks / self.track.name)
+        self.recover()
 
         self.timer_fired()
         self.ui.start_mainloop()
+        self.journal.close()  # edits still unsaved are offered back on the next start
+        self.ui.raster.close()
 
     def start_session(self):
         self.time_now = time.time()
-        self.undoStack = []
-        self.redoStack = []
+        self.history = History()
         self.world.collisionPoints = []
 
+    @property
+    def rider(self):
+        return self.simulation.rider
+
+    def step_forward(self):
+        self.simulation.record_collisions = self.ui.show_collisions
+        self.simulation.step()
+
     def timer_fired(self):
         start = time.perf_counter()
         if not self.player.is_paused:
-            self.world.step_forward()
+            self.step_forward()
         self.player.update_camera()
         self.ui.update_cursor()
+        self.ui.update_scrub_bar()
         self.ui.redraw_all()
 
         # an attempt to keep a constant fps
@@ -54,9 +72,9 @@ class App:
     def reset_rider(self, from_beginning=False):
         """Places rider on starting point OR on flag point"""
         if from_beginning or not self.player.flag:
-            self.rider.rebuild(self.track.startPoint)
+            self.simulation.reset()
         else:
-            self.rider = copy.deepcopy(self.player.flagged_rider)
+            self.simulation.reset(copy.deepcopy(self.player.flagged_rider), self.player.flagged_frame)
 
 
     #####
@@ -69,13 +87,37 @@ class App:
         self.start_session()
         self.reset_rider()
 
-    def reload_on_exit_save(self):
-        # TODO: Make it open the last track saved!
-        path = "savedLines/ONEXITSAVE_"
-        if os.path.isfile(path):
-            with open(path, "rb") as track:
-                self.track = pickle.load(track, encoding='latin1')
-            # self.track.grid.reset_grid() not needed because use of track.import_()
+    def recover(self):
+        """Offers to bring back edits that were journaled but never saved, when the app last stopped"""
+        journals = sorted(self.dir_tracks.glob(f'*{journal.SUFFIX}'), key=lambda path: path.stat().st_mtime,
+                          reverse=True)
+        for path in journals:
+            records, saved, _ = journal.read(path)
+            if len(records) == saved:
+                continue
+            track_path = journal.track_path(path)
+            if self.ui.open_popup('ok_or_cancel', 'Unsaved edits',
+                                  f'{len(records) - saved} edits of {track_path.name} were not saved.\nRecover them?'):
+                self.load_track(track_path, with_unsaved=True)
+                return
+            journal.discard_unsaved(path)
+
+    def load_track(self, path, with_unsaved=False):
+        """Opens the track saved at path, with the edits journaled since it was written (see Journal)
+        with_unsaved: with the edits that were never saved too"""
+        payload = track_file.load_payload(path) if path.exists() else {'lines': []}  # never saved: journal only
+        self.journal.close(discard_unsaved_edits=True)  # the user agreed to lose them, see open_track
+        records, saved, _ = journal.read(journal.journal_path(path))
+        self.track.import_(payload)
+        journal.replay(self.track, records if with_unsaved else records[:saved])
+        if path.exists():
+            self.track.name = path.name
+        self.track.track_modified(with_unsaved and len(records) > saved)
+        self.journal = journal.Journal(self.track, path, keep_unsaved=with_unsaved)
+
+        self.start_session()
+        self.rider.rebuild(self.track.startPoint)
+        self.reset_rider()
 
     def open_track(self):
         if self.track.edits_not_saved:
@@ -90,29 +132,35 @@ class App:
             print(f'Opening track {track_to_load}')
 
             # Read the file, and THEN try to load it
-            with open(track_to_load, "rb") as pickled_track:
-                try:
-                    dict_track = pickle.load(pickled_track)
-                except Exception as error:
-                    popup.fail(f'Error while opening track: {error}')
-            self.track.import_(dict_track)
+            try:
+                self.load_track(track_to_load)
+            except Exception as error:
+                popup.fail(f'Error while opening track: {error}')
+                return
             # TODO: Add something in case loading didn't work out (use backup!)
             popup.success()
 
-            self.start_session()
-            self.rider.rebuild(self.track.startPoint)
-            self.reset_rider()
-
         _ = LoadPopup(
             title='Open track',
-            track_list=[file.name for file in self.dir_tracks.iterdir()],
+            track_list=[file.name for file in self.dir_tracks.iterdir()
+                        if file.is_file() and file.suffix not in (journal.SUFFIX, '.tmp')],
             clickopen_callback=clickopen_callback
         )
 
-    def write_pickled_track_on_disk(self, filepath, export_payload):
+    def write_track_on_disk(self, filepath):
+        """Saves the track at filepath: only the edits since the last save if it is where the track was saved,
+        the whole track otherwise. Saving the edits does not wait for the disk, see journal_saved"""
         try:
-            with open(filepath, 'wb') as pkl_handle:
-                pickle.dump(export_payload, pkl_handle)
+            if filepath == self.journal.path and filepath.exists():
+                self.track.track_modified(False)
+                self.track.save_statustag = "Saving..."
+                self.journal.save(self.journal_saved)
+                return True
+            if filepath != self.journal.path:
+                journal.journal_path(filepath).unlink(missing_ok=True)  # edits of the track overwritten
+            track_file.write(self.track, filepath, keep_ids=True)  # the new journal addresses lines by ID
+            self.journal.close(discard_unsaved_edits=True)  # they are in the track file now
+            self.journal = journal.Journal(self.track, filepath)
             self.track.track_modified(False)
             self.track.save_statustag = "Saved!"
             return True
@@ -121,15 +169,23 @@ class App:
             self.track.save_statustag = "Failed to save! D:"
             return False
 
-    def save_track(self, popup=False):
-        export_payload = self.track.build_export_payload()
+    def journal_saved(self, error):
+        """Reports a save of the journal, once on disk. Called from the writer thread of the journal:
+        only the status changes, the next frame shows it"""
+        if error is not None:
+            print(f'Error while saving: {error}')
+            self.track.track_modified()
+            self.track.save_statustag = "Failed to save! D:"
+        elif not self.track.edits_not_saved:
+            self.track.save_statustag = "Saved!"
 
+    def save_track(self, popup=False):
         def clicksave_callback(popup, trackname, overwrite=False):
             filepath = self.dir_tracks / trackname
             if filepath.exists() and not overwrite:
                 popup.ask_if_overwrite()
             else:
-                if self.write_pickled_track_on_disk(filepath, export_payload):
+                if self.write_track_on_disk(filepath):
                     self.track.name = trackname
                     popup.success()
                 else:
@@ -143,7 +199,7 @@ class App:
             )
         else:  # CTRL+S or [X] and name already modified -> Just save, no popup
             filepath = self.dir_tracks / self.track.name
-            if self.write_pickled_track_on_disk(filepath, export_payload):
+            if self.write_track_on_disk(filepath):
                 return True
             return False
 
@@ -151,23 +207,15 @@ class App:
     # Undo, redo
     #####
     def add_to_history(self, action, undo, redo):
-        if undo:
-            self.redoStack += [action]
-        else:  # else, put in undo stack
-            self.undoStack += [action]
-            if len(self.undoStack) > 500:  # it's up to the user to back up :|
-                self.undoStack.pop(0)
+        """action: (objects, command) reverting an edit, see History"""
+        self.history.record(action, undo, redo)
         self.track.track_modified()
 
     def undo_cmd(self):
-        if len(self.undoStack) > 0:
-            obj, command = self.undoStack.pop(-1)
-            command(obj, undo=True)
+        self.history.undo()
 
     def redo_cmd(self):
-        if len(self.redoStack) > 0:
-            obj, command = self.redoStack.pop(-1)
-            command(obj, redo=True)
+        self.history.redo()
 
 
 if __name__ == "__main__":
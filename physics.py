@@ -1,10 +1,10 @@
 
 
 
-from geometry import Point, distance
+from geometry import PointView
 
 class Constraint:
-    def __init__(self, pnt1: Point, pnt2: Point, rest_length):  #p1 and p2 are points
+    def __init__(self, pnt1: PointView, pnt2: PointView, rest_length):  #p1 and p2 are points of the same PointArray
         self.pnt1, self.pnt2 = pnt1, pnt2
         self.rest_length = rest_length
 
@@ -15,26 +15,33 @@ class Constraint:
         """Resolves the constraint by bringing p1 and p2 closer to each-other.
         The higher the difference between length and rest-length, the bigger the correction to get them back together
         neg_factor_only: For legs
-        static_p1: One-sided constraint for scarf"""
-        delta = self.pnt1.r - self.pnt2.r
-        length = distance(self.pnt1.r, self.pnt2.r)  # Was delta.magnitude() before, but why?
+        static_p1: One-sided constraint for scarf
+        Works directly on the rider's point arrays, without building Vectors"""
+        x, y, i, j = self.pnt1.array.x, self.pnt1.array.y, self.pnt1.i, self.pnt2.i
+        dx, dy = x[i] - x[j], y[i] - y[j]
+        length = (dx ** 2 + dy ** 2) ** 0.5
         factor = (length - self.rest_length) / length
 
         if neg_factor_only:
             if factor < 0:
-                self.pnt1.r -= delta * factor / 2
-                self.pnt2.r += delta * factor / 2
+                x[i] -= dx * factor / 2
+                y[i] -= dy * factor / 2
+                x[j] += dx * factor / 2
+                y[j] += dy * factor / 2
         elif static_p1:
-            self.pnt2.r += delta * factor
+            x[j] += dx * factor
+            y[j] += dy * factor
         else:
-            self.pnt1.r -= delta * factor / 2
-            self.pnt2.r += delta * factor / 2
+            x[i] -= dx * factor / 2
+            y[i] -= dy * factor / 2
+            x[j] += dx * factor / 2
+            y[j] += dy * factor / 2
 
     def check_endurance(self, rider):
         """if the ratio of the difference of length is beyond a certain
             limit, destroy line rider's attachment to the sled"""
-        delta = self.pnt1.r - self.pnt2.r
-        diff = (delta.magnitude() - self.rest_length)
+        x, y, i, j = self.pnt1.array.x, self.pnt1.array.y, self.pnt1.i, self.pnt2.i
+        diff = ((x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2) ** 0.5 - self.rest_length
         ratio = abs(diff / self.rest_length)
         if ratio > rider.endurance:
             rider.kill_bosh()  # remove constraints
@@ -8,18 +8,32 @@ from geometry import Vector
 class Player:
     def __init__(self, app):
         self.app = app
-        self.is_paused = True
+        self._is_paused = True
         self.slowmo = False
         self.follow = True
         self.flag = False
         self.flagged_rider = None
+        self.flagged_frame = 0
 
         self.snap_radius = 10
         self.snap_ruler = True
 
         self.zoom = 1
         self.panPos = Vector(0, 0)
-        self.cam = self.panPos
+        self.cam = Vector(0, 0)  # updated in place, see update_camera
+
+    @property
+    def is_paused(self):
+        return self._is_paused
+
+    @is_paused.setter
+    def is_paused(self, value):
+        """The track is frozen for physics while playing, since it cannot be edited"""
+        self._is_paused = value
+        if value:
+            self.app.track.unfreeze()
+        else:
+            self.app.track.freeze()
 
     def set_zoom(self, new_zoom):
         if 0.1 < new_zoom < 10:
@@ -27,7 +41,7 @@ class Player:
 
     def set_panpos(self):
         self.panPos = Vector(0, 0) - self.app.ui.canvas_center
-        self.cam = self.panPos
+        self.cam.set(self.panPos.x, self.panPos.y)
 
     def stop(self):
         self.is_paused = True
@@ -45,25 +59,35 @@ class Player:
         self.is_paused = False
         self.app.reset_rider(True)
 
+    def seek(self, frame: int):
+        """Jumps to any frame of the run, from the closest checkpoint of the simulation"""
+        self.app.simulation.seek(frame)
+
+    def step_backward(self):
+        if self.is_paused:
+            self.seek(self.app.simulation.frame - 1)
+
     def toggle_slowmo(self):
         if not self.is_paused:
             self.slowmo = not self.slowmo
 
     def update_camera(self):
         # Bugfix needed: When set a flag and hit pause, the camera doesn't center on flag
-        if self.is_paused or not self.follow:
-            self.cam = self.panPos + self.app.ui.canvas_center
-        else:
-            self.cam = self.app.rider.pos.r
+        # the camera and the canvas corners are updated in place, once per frame
         c = self.app.ui.canvas_center
         z = self.zoom
         cam = self.cam
-        self.app.ui.canvas_topleft = cam - c / z
-        self.app.ui.canvas_bottomright = cam + c / z
+        if self.is_paused or not self.follow:
+            cam.set(self.panPos.x, self.panPos.y).iadd_scaled(c, 1)
+        else:
+            self.app.rider.pos.r_into(cam)
+        self.app.ui.canvas_topleft.set(cam.x - c.x / z, cam.y - c.y / z)
+        self.app.ui.canvas_bottomright.set(cam.x + c.x / z, cam.y + c.y / z)
 
     def set_flag(self):
         self.flag = True
         self.flagged_rider = copy.deepcopy(self.app.rider)
+        self.flagged_frame = self.app.simulation.frame
         # very tricky part here - Why deactivated?
         # self.flagged_rider.accQueueNow = copy.copy(self.rider.accQueuePast)
 
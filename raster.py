@@ -0,0 +1,289 @@
+""" In this module:
+Class RasterLayer
+"""
+
+import math
+import queue
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import tkinter as tk
+
+from geometry import Vector
+from line_layer import RETAINED
+from line_store import INK_CODES
+from tool_helpers import Ink
+
+RASTER = 'raster'  # tag of the image items of tiles
+COLOURS = {INK_CODES[Ink.Solid]: (0, 0, 0), INK_CODES[Ink.Acc]: (255, 0, 0), INK_CODES[Ink.Scene]: (0, 255, 0)}
+ARROW = (8, 10, 3)  # shape of the arrows of acceleration lines, as Tk draws them by default
+LOOKAHEAD = 15  # frames of camera motion the tiles are rendered ahead of
+
+
+class RasterLayer:
+    """Track lines drawn as image tiles, for Tk to draw a few images rather than many lines.
+    Tiles are squares of tile_pixels on screen, keyed by level, (zoom, paused, width), and tile coordinates.
+    A worker thread renders them, as PNG data, from the segments the main thread gathers (the track and Tk are only
+    used from the main thread): those in view first, then those where the camera is going, then those around.
+    Tiles are kept in an LRU cache of at most memory_cap bytes (of decoded pixels). Edits drop the tiles the line
+    touches. Tiles are only shown once all of those in view are rendered: until then, LineLayer draws the lines"""
+    def __init__(self, canvas: tk.Canvas, tile_pixels: int = 256, memory_cap: int = 64 * 2 ** 20,
+                 max_pending: int = 16):
+        self.canvas = canvas
+        self.tile_pixels = tile_pixels
+        self.memory_cap = memory_cap
+        self.max_pending = max_pending
+        self.tiles = OrderedDict()  # (level, tile) -> PhotoImage, least recently used first
+        self.pending = dict()  # (level, tile) -> ticket of the job rendering it
+        self.tickets = 0
+        self.items = dict()  # tile -> image item, for the level and view shown
+        self.level = None
+        self.view = None  # (cam x, cam y, center x, center y) the items are placed for
+        self.last_cam = None
+        self.jobs = queue.Queue()  # (key, ticket, segments) for the worker
+        self.results = queue.Queue()  # (key, ticket, png data) from the worker
+        self.thread = threading.Thread(target=self.run, name='raster', daemon=True)
+        self.thread.start()
+
+    def __repr__(self):
+        return f'RasterLayer({len(self.tiles)} tiles, {self.memory / 2 ** 20:.1f} MB, {len(self.pending)} pending)'
+
+    @property
+    def memory(self):
+        return len(self.tiles) * self.tile_pixels ** 2 * 4
+
+    def close(self):
+        self.jobs.put(None)
+        self.thread.join()
+
+    def line_edited(self, line):
+        """Edit listener of the track: drops the tiles of the line, at every level"""
+        if line is None:  # the whole track changed
+            keys = list(self.tiles) + list(self.pending)
+        else:
+            keys = []
+            for level in {key[0] for key in self.tiles} | {key[0] for key in self.pending}:
+                zoom, _, width = level
+                reach = width / 2 + ARROW[1] + 1
+                x_min, y_min = self.tile_at(min(line.r1.x, line.r2.x) * zoom - reach, min(line.r1.y, line.r2.y) * zoom - reach)
+                x_max, y_max = self.tile_at(max(line.r1.x, line.r2.x) * zoom + reach, max(line.r1.y, line.r2.y) * zoom + reach)
+                keys += [(level, (x, y)) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+        for key in keys:
+            self.pending.pop(key, None)
+            if self.tiles.pop(key, None) is not None and key[0] == self.level and key[1] in self.items:
+                self.canvas.delete(self.items.pop(key[1]))
+
+    def tile_at(self, x, y):
+        """Tile of a point in world coordinates times zoom"""
+        return int(x // self.tile_pixels), int(y // self.tile_pixels)
+
+    def update(self, track, cam, zoom: float, center, paused: bool, width: float):
+        """Asks for the tiles in view, and those ahead, then shows the tiles in view if all of them are rendered.
+        Returns whether they are"""
+        self.receive()
+        level = (zoom, paused, width)
+        if level != self.level:
+            self.clear()
+            self.level = level
+        view = (cam.x, cam.y, center.x, center.y)
+        if self.items and view != self.view:
+            self.canvas.move(RASTER, (self.view[0] - cam.x) * zoom + center.x - self.view[2],
+                             (self.view[1] - cam.y) * zoom + center.y - self.view[3])
+        self.view = view
+
+        in_view = self.tiles_in_view(cam, zoom, center)
+        motion = cam - self.last_cam if self.last_cam is not None else Vector(0, 0)
+        self.last_cam = Vector(cam.x, cam.y)
+        ahead = self.tiles_in_view(cam + motion * LOOKAHEAD, zoom, center, ring=1)
+        wanted = {(level, tile) for tile in in_view + ahead}
+        self.pending = {key: ticket for key, ticket in self.pending.items() if key in wanted}  # the worker skips others
+        for tile in in_view + ahead:
+            key = (level, tile)
+            if key in self.tiles:
+                self.tiles.move_to_end(key)
+            elif key not in self.pending and len(self.pending) < self.max_pending:
+                self.request(track, key)
+
+        ready = all((level, tile) in self.tiles for tile in in_view)
+        for tile in [tile for tile in self.items if tile not in in_view]:
+            self.canvas.delete(self.items.pop(tile))
+        if ready:
+            for tile in in_view:
+                if tile not in self.items:
+                    self.items[tile] = self.canvas.create_image(
+                        tile[0] * self.tile_pixels - cam.x * zoom + center.x,
+                        tile[1] * self.tile_pixels - cam.y * zoom + center.y,
+                        image=self.tiles[(level, tile)], anchor=tk.NW, tags=(RETAINED, RASTER))
+                    self.canvas.tag_lower(self.items[tile])  # under the rider
+        self.canvas.itemconfigure(RASTER, state=tk.NORMAL if ready else tk.HIDDEN)
+        self.trim()
+        return ready
+
+    def hide(self):
+        self.clear()
+        self.level = None
+
+    def clear(self):
+        self.canvas.delete(RASTER)
+        self.items.clear()
+
+    def tiles_in_view(self, cam, zoom, center, ring=0):
+        """Tiles the canvas overlaps, and the ring of tiles around them, nearest to the camera first"""
+        x_min, y_min = self.tile_at(cam.x * zoom - center.x, cam.y * zoom - center.y)
+        x_max, y_max = self.tile_at(cam.x * zoom + center.x, cam.y * zoom + center.y)
+        x_cam, y_cam = self.tile_at(cam.x * zoom, cam.y * zoom)
+        tiles = [(x, y) for x in range(x_min - ring, x_max + ring + 1) for y in range(y_min - ring, y_max + ring + 1)]
+        tiles.sort(key=lambda tile: abs(tile[0] - x_cam) + abs(tile[1] - y_cam))
+        return tiles
+
+    def request(self, track, key):
+        """Gathers the segments of the tile, in pixels from its corner, and queues them for the worker"""
+        (zoom, paused, width), (x, y) = key
+        left, top = x * self.tile_pixels, y * self.tile_pixels
+        reach = Vector(1, 1) * ((width / 2 + ARROW[1] + 1) / zoom)
+        lines = track.lines
+        corner = Vector(left, top) / zoom
+        size = Vector(1, 1) * (self.tile_pixels / zoom)
+        acc = INK_CODES[Ink.Acc]
+        segments = [
+            (lines.inks[line_id], lines.x1[line_id] * zoom - left, lines.y1[line_id] * zoom - top,
+             lines.x2[line_id] * zoom - left, lines.y2[line_id] * zoom - top,
+             paused and lines.inks[line_id] == acc and track.chains.is_last(line_id))
+            for line_id in track.get_line_ids_between(corner - reach, corner + size + reach)
+        ]
+        self.tickets += 1
+        self.pending[key] = self.tickets
+        self.jobs.put((key, self.tickets, segments))
+
+    def receive(self):
+        """Turns the tiles rendered since the last frame into images"""
+        while True:
+            try:
+                key, ticket, data = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if self.pending.get(key) == ticket:  # not edited since it was asked for
+                del self.pending[key]
+                self.tiles[key] = tk.PhotoImage(master=self.canvas, data=data, format='png')
+
+    def trim(self):
+        """Drops the least recently used tiles over the memory cap, but not those shown"""
+        for key in list(self.tiles):
+            if self.memory <= self.memory_cap:
+                return
+            if key[0] != self.level or key[1] not in self.items:
+                del self.tiles[key]
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            key, ticket, segments = job
+            if self.pending.get(key) != ticket:  # dropped while queued
+                continue
+            (zoom, paused, width), _ = key
+            try:
+                pixels = rasterize(segments, self.tile_pixels, width, paused)
+                self.results.put((key, ticket, encode_png(pixels, self.tile_pixels)))
+            except Exception as error:
+                print(f'Error while rendering a tile: {error}')
+
+
+def rasterize(segments, size, width, paused):
+    """RGBA pixels of a square of size pixels with the segments (ink code, x1, y1, x2, y2, arrow) drawn on it,
+    the way LineLayer draws them: round caps and joins, colours when paused, and the arrow at the end of a chain
+    of acceleration lines. Edges are antialiased"""
+    pixels = bytearray(size * size * 4)
+    radius = width / 2
+    for ink, x1, y1, x2, y2, arrow in segments:
+        colour = COLOURS[ink] if paused else COLOURS[INK_CODES[Ink.Solid]]
+        if arrow:
+            x2, y2 = draw_arrow(pixels, size, colour, radius, x1, y1, x2, y2)
+        draw_segment(pixels, size, colour, radius, x1, y1, x2, y2)
+    return pixels
+
+
+def draw_segment(pixels, size, colour, radius, x1, y1, x2, y2):
+    """Draws a segment with round caps, row by row: on each row, only the pixels of the interval where the
+    capsule (widened by half a pixel for antialiasing) crosses it are visited"""
+    dx, dy = x2 - x1, y2 - y1
+    length = math.hypot(dx, dy)
+    ux, uy = (dx / length, dy / length) if length else (0, 0)
+    reach = radius + 0.5
+    for row in range(max(0, int(min(y1, y2) - reach)), min(size, int(max(y1, y2) + reach) + 1)):
+        y = row + 0.5
+        lows, highs = [], []
+        for cx, cy in ((x1, y1), (x2, y2)):  # caps
+            if abs(y - cy) <= reach:
+                half = math.sqrt(reach * reach - (y - cy) ** 2)
+                lows.append(cx - half)
+                highs.append(cx + half)
+        if length:  # body: |cross(p - r1, u)| <= reach and 0 <= dot(p - r1, u) <= length
+            low, high = -math.inf, math.inf
+            for offset, factor, lo, hi in (((y - y1) * ux, uy, -reach, reach), (-(y - y1) * uy, ux, 0, length)):
+                if factor:
+                    a, b = (lo + offset) / factor, (hi + offset) / factor
+                    low, high = max(low, min(a, b)), min(high, max(a, b))
+                elif not lo <= -offset <= hi:
+                    low, high = math.inf, -math.inf
+            if low <= high:
+                lows.append(x1 + low)
+                highs.append(x1 + high)
+        if not lows:
+            continue
+        for column in range(max(0, int(min(lows))), min(size, int(max(highs)) + 1)):
+            px, py = column + 0.5 - x1, y - y1
+            t = min(length, max(0, px * ux + py * uy))
+            coverage = radius + 0.5 - math.hypot(px - t * ux, py - t * uy)
+            if coverage > 0:
+                plot(pixels, size, column, row, colour, min(coverage, 1))
+
+
+def draw_arrow(pixels, size, colour, radius, x1, y1, x2, y2):
+    """Draws the arrow at the end of a segment, and returns where the segment should stop, as Tk does"""
+    length = math.hypot(x2 - x1, y2 - y1)
+    if not length:
+        return x2, y2
+    ux, uy = (x2 - x1) / length, (y2 - y1) / length
+    neck, back, side = ARROW
+    side += radius
+    polygon = [(x2, y2), (x2 - back * ux - side * uy, y2 - back * uy + side * ux),
+               (x2 - neck * ux, y2 - neck * uy), (x2 - back * ux + side * uy, y2 - back * uy - side * ux)]
+    xs, ys = [x for x, _ in polygon], [y for _, y in polygon]
+    for row in range(max(0, int(min(ys))), min(size, int(max(ys)) + 1)):
+        for column in range(max(0, int(min(xs))), min(size, int(max(xs)) + 1)):
+            if inside(polygon, column + 0.5, row + 0.5):
+                plot(pixels, size, column, row, colour, 1)
+    return x2 - neck * ux, y2 - neck * uy
+
+
+def inside(polygon, x, y):
+    """Even-odd test of a point against a polygon"""
+    result = False
+    for (ax, ay), (bx, by) in zip(polygon, polygon[-1:] + polygon[:-1]):
+        if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+            result = not result
+    return result
+
+
+def plot(pixels, size, column, row, colour, coverage):
+    """Sets a pixel, unless it is already more opaque"""
+    k = (row * size + column) * 4
+    alpha = int(coverage * 255)
+    if alpha > pixels[k + 3]:
+        pixels[k:k + 4] = bytes((*colour, alpha))
+
+
+def encode_png(pixels, size):
+    """PNG data of square RGBA pixels"""
+    stride = size * 4
+    raw = b''.join(b'\x00' + pixels[row * stride:(row + 1) * stride] for row in range(size))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b''))
@@ -3,25 +3,38 @@
 import copy
 import tkinter as tk
 
-from geometry import Point, Vector
-from shapes import LineShape, Arc, Polygon, Circle
+from geometry import PointArray, Vector
+from shapes import LineShape, Arc, Part, Polygon, Circle
 from physics import cnstr
+from timeline import RiderState
 
 
 
 
 
 class Rider:
-    def __init__(self, start_point):  # make_rider() | startPoint = self.app.track.startPoint
+    def __init__(self, start_point, velocity: Vector = None, body: PointArray = None):
+        """velocity: initial velocity, the rider starts at rest if not given
+        body: arrays to add the points of the rider to, to share them with other riders (see RiderBatch)"""
         self.onSled = True
         self.endurance = 0.4
-        self.accQueuePast = dict()
+        self.accQueuePast = dict()  # point index -> acceleration lines
         self.accQueueNow = dict()
 
-        # Points
-        sled = [Point(0, 0), Point(0, 10), Point(30, 10), Point(35, 0)]
-        bosh = [Point(10, 0), Point(10, -11), Point(23, -10), Point(23, -10), Point(20, 10), Point(20, 10)]
-        scrf = [Point(7, -10), Point(3, -10), Point(0, -10), Point(-4, -10), Point(-7, -10), Point(-11, -10)]
+        # Points: all stored in the same arrays, body first then scarf. Scarves are special :|
+        bosh_coords = [(10, 0), (10, -11), (23, -10), (23, -10), (20, 10), (20, 10)]
+        sled_coords = [(0, 0), (0, 10), (30, 10), (35, 0)]
+        scrf_coords = [(7, -10), (3, -10), (0, -10), (-4, -10), (-7, -10), (-11, -10)]
+        coords = [(x + start_point.x, y + start_point.y) for (x, y) in bosh_coords + sled_coords + scrf_coords]
+        self.body = body if body is not None else PointArray([], [])
+        self.offset = offset = self.body.extend(coords, masses=[1] * 10 + [0.5] * 6)
+        self.size = len(coords)
+        if velocity is not None:
+            for i in range(offset, offset + self.size):
+                self.body.x0[i] -= velocity.x
+                self.body.y0[i] -= velocity.y
+        bosh, sled, scrf = (self.body.views(offset, offset + 6), self.body.views(offset + 6, offset + 10),
+                            self.body.views(offset + 10, offset + 16))
 
         # Constraints
         sledC = [cnstr(sled[0], sled[1]), cnstr(sled[1], sled[2]), cnstr(sled[2], sled[3]), cnstr(sled[3], sled[0]),
@@ -40,13 +53,11 @@ class Rider:
             (bosh[0], bosh[1]), (bosh[1], bosh[3])
         )
         self.sledString = ((bosh[2], sled[3]), (bosh[3], sled[3]))
-        for point in sled + bosh + scrf:
-            point.r += start_point
-            point.r0 += start_point - Vector(0, 0)  #
         self.points = bosh + sled
         self.scarf = scrf
 
-        self.constraints = sledC + boshC + slshC
+        self.sledBoshC = sledC + boshC
+        self.constraints = self.sledBoshC + slshC
         self.slshC = slshC
         self.legsC = legsC
         self.scarfCnstr = scrfC
@@ -99,7 +110,7 @@ class Rider:
         ]
         arm2 = copy.deepcopy(arm1)
         leg2 = copy.deepcopy(leg1)
-        return [arm1, leg1, sled, leg2, body, arm2]
+        return [Part(shapes) for shapes in (arm1, leg1, sled, leg2, body, arm2)]
 
     def gen_flag_drawings(self):
         parts = copy.deepcopy(self.drawing_vectors)
@@ -118,8 +129,42 @@ class Rider:
     def rebuild(self, start_point):
         self.__init__(start_point)
 
+    def get_state(self):
+        body, start, stop = self.body, self.offset, self.offset + self.size
+        acc_queue = {i: set(line_ids) for i, line_ids in self.accQueueNow.items()}
+        return RiderState(body.x[start:stop] + body.y[start:stop] + body.x0[start:stop] + body.y0[start:stop],
+                          self.onSled, acc_queue)
+
+    def set_state(self, state: RiderState):
+        body, start, stop, n = self.body, self.offset, self.offset + self.size, self.size
+        body.x[start:stop], body.y[start:stop] = state.coords[:n], state.coords[n:2 * n]
+        body.x0[start:stop], body.y0[start:stop] = state.coords[2 * n:3 * n], state.coords[3 * n:]
+        self.onSled = state.on_sled
+        self.constraints = self.sledBoshC + self.slshC if self.onSled else list(self.sledBoshC)
+        self.accQueueNow = {i: set(line_ids) for i, line_ids in state.acc_queue.items()}
+        self.accQueuePast = dict()
+
     def kill_bosh(self):
         if self.onSled:
             self.constraints = self.constraints[:-8]
             self.onSled = False
 
+
+class RiderBatch:
+    """Riders whose points all live in the same arrays, so that the world integrates them,
+    resolves their constraints and collides them together"""
+    def __init__(self, start_points, velocities=None):
+        self.body = PointArray([], [])
+        velocities = velocities if velocities is not None else [None] * len(start_points)
+        self.riders = [Rider(start, velocity, body=self.body) for start, velocity in zip(start_points, velocities)]
+
+    def __len__(self):
+        return len(self.riders)
+
+    def __iter__(self):
+        return iter(self.riders)
+
+    @classmethod
+    def spread(cls, start_point: Vector, velocities):
+        """Riders all starting from the same point, each with its own initial velocity"""
+        return cls([start_point] * len(velocities), velocities)
@@ -5,17 +5,52 @@ import tkinter as tk
 from geometry import Vector
 
 
+class Part:
+    """Shapes of a part of the rider, which all turn with it.
+    The vertices of all the shapes are flattened once, into a list of x and one of y: rendering turns the position
+    and angle of the part into a single affine transform to the screen (rotation, zoom and camera), applied to all
+    of them at once, then each shape draws its own slice of the result"""
+    def __init__(self, shapes):
+        self.shapes = shapes
+        self.xs = [cor.x for shape in shapes for cor in shape.cors]
+        self.ys = [cor.y for shape in shapes for cor in shape.cors]
+        self.spans = []  # (shape, first coordinate, end coordinate) in the transformed vertices
+        start = 0
+        for shape in shapes:
+            self.spans.append((shape, 2 * start, 2 * (start + len(shape.cors))))
+            start += len(shape.cors)
+
+    def __iter__(self):
+        return iter(self.shapes)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def render(self, pnt0, angle, app):
+        """Draws the shapes turned by angle (radians) around pnt0, in world coordinates"""
+        player, center = app.player, app.ui.canvas_center
+        zoom = player.zoom
+        a, b = zoom * math.cos(angle), zoom * math.sin(angle)
+        tx, ty = (pnt0.x - player.cam.x) * zoom + center.x, (pnt0.y - player.cam.y) * zoom + center.y
+        coords = [value for x, y in zip(self.xs, self.ys) for value in (a * x - b * y + tx, b * x + a * y + ty)]
+        for shape, start, end in self.spans:
+            shape.draw(app.ui.canvas, coords[start:end], zoom, angle)
+
+
 class Shape:
     # [type, [coords], fill=fColor, outline=oColor, width=w, special
     #special: (r, start, extent) or (smooth, cap)]    cors = copy.copy(sgmnt[0])
     def __init__(self, cors, fillColor, lineColor, width):
         for i in range(len(cors)):
-            cors[i] = Vector(cors[i]) * 0.25  #scale
+            cors[i] = Vector(*cors[i]) * 0.25  #scale
         self.cors = cors
         self.fillColor = fillColor
         self.lineColor = lineColor
         self.width = width
 
+    def screen_width(self, zoom):
+        return self.width if self.width == 1 else self.width * zoom * 0.25
+
 
 class LineShape(Shape):
     def __init__(self, cors, fillColor=None, lineColor="black", width=1, smooth=False, cap=tk.ROUND):
@@ -23,16 +58,9 @@ class LineShape(Shape):
         self.isSmooth = smooth
         self.capstyle = cap
 
-    def render(self, pnt0, angle, app):
-        w = self.width
-        if w != 1:
-            w *= app.player.zoom * 0.25
-        cors = []
-        for i in range(len(self.cors)):
-            cor = self.cors[i].rotate(angle)
-            cor = app.player.adjust_pz(cor + pnt0)
-            cors += (cor.x, cor.y)  #convert to tuples, put into list
-        app.ui.canvas.create_line(cors, fill=self.lineColor, width=w,
+    def draw(self, canvas, cors, zoom, angle):
+        """cors: screen coordinates of the vertices, see Part.render"""
+        canvas.create_line(cors, fill=self.lineColor, width=self.screen_width(zoom),
                            joinstyle=tk.MITER, capstyle=self.capstyle)
 
 
@@ -41,17 +69,9 @@ class Polygon(Shape):
         super(Polygon, self).__init__(cors, fillColor, lineColor, width)
         self.isSmooth = smooth
 
-    def render(self, pnt0, angle, app):
-        w = self.width
-        if w != 1:
-            w *= app.player.zoom * 0.25
-        cors = []
-        for i in range(len(self.cors)):
-            cor = self.cors[i].rotate(angle)
-            cor = app.player.adjust_pz(cor + pnt0)
-            cors += (cor.x, cor.y)  #convert to tuples, put into list
-        app.ui.canvas.create_polygon(cors, fill=self.fillColor, outline=self.lineColor,
-                              smooth=self.isSmooth, width=w)
+    def draw(self, canvas, cors, zoom, angle):
+        canvas.create_polygon(cors, fill=self.fillColor, outline=self.lineColor,
+                              smooth=self.isSmooth, width=self.screen_width(zoom))
 
 
 class Arc(Shape):  #also pieslice
@@ -62,22 +82,18 @@ class Arc(Shape):  #also pieslice
         self.start = theta[1]
         self.extent = theta[2]
 
-    def render(self, pnt0, angle, app):
-        center = self.center.rotate(angle)
-        center = app.player.adjust_pz(center + pnt0)
-        x, y = center.x, center.y
-        w = self.width
-        if w != 1:
-            w *= app.player.zoom * 0.25
+    def draw(self, canvas, cors, zoom, angle):
+        x, y = cors
+        w = self.screen_width(zoom)
         angle = math.degrees(angle)
         strt = self.start - angle
-        r = self.radius * app.player.zoom
+        r = self.radius * zoom
         if self.fillColor == None:
-            app.ui.canvas.create_arc(x + r, y + r, x - r, y - r, style=tk.ARC,
+            canvas.create_arc(x + r, y + r, x - r, y - r, style=tk.ARC,
                               start=strt, extent=self.extent,
                               width=w, outline=self.lineColor)
         else:
-            app.ui.canvas.create_arc(x + r, y + r, x - r, y - r, style=tk.PIESLICE, width=w,
+            canvas.create_arc(x + r, y + r, x - r, y - r, style=tk.PIESLICE, width=w,
                               start=strt, extent=self.extent,
                               fill=self.fillColor, outline=self.lineColor)
 
@@ -88,13 +104,8 @@ class Circle(Shape):
         self.center = self.cors[0]
         self.radius = radius * 0.25
 
-    def render(self, pnt0, angle, app):
-        center = self.center.rotate(angle)
-        center = app.player.adjust_pz(center + pnt0)
-        x, y = center.x, center.y
-        w = self.width
-        if w != 1:
-            w *= app.player.zoom * 0.25
-        r = self.radius * app.player.zoom
-        app.ui.canvas.create_oval(x + r, y + r, x - r, y - r, width=w,
+    def draw(self, canvas, cors, zoom, angle):
+        x, y = cors
+        r = self.radius * zoom
+        canvas.create_oval(x + r, y + r, x - r, y - r, width=self.screen_width(zoom),
                            fill=self.fillColor, outline=self.lineColor)
@@ -0,0 +1,172 @@
+""" In this module:
+Class Simulation
+Class BatchSimulation
+
+Headless simulation core: a track, a rider and a world, stepped frame by frame.
+No Tk window, no App, no frame pacing - as fast as the physics goes.
+"""
+
+import argparse
+import time
+
+from world import World
+from track import Track
+from rider import Rider, RiderBatch
+from timeline import Timeline
+from geometry import Vector
+from tool_helpers import Ink
+import track_file
+
+
+class Simulation:
+    def __init__(self, track: Track, rider: Rider = None, world: World = None, timeline: Timeline = None):
+        self.track = track
+        self.world = world if world is not None else World()
+        self.rider = rider if rider is not None else Rider(track.startPoint)
+        self.frame = 0
+        self.max_frame = 0  # furthest frame simulated since the track last changed
+        self.up_to_date = True  # False when the track changed under the current frame
+        self.record_collisions = False
+        self.cell_first_frame = dict()  # grid cell -> first frame whose physics looked it up
+        self.timeline = timeline if timeline is not None else Timeline()
+        self.timeline.record(0, self.rider.get_state())
+        self.track.edit_listeners.append(self.track_edited)
+
+    @classmethod
+    def from_payload(cls, payload, **world_params):
+        """Builds a simulation from a track export payload (see Track.build_export_payload)"""
+        track = Track()
+        track.import_(payload)
+        track.freeze()  # nothing edits it
+        return cls(track, world=World(**world_params))
+
+    def step(self, n: int = 1):
+        """Moves the rider n frames forward. If the track changed under the current frame,
+        the rider is first simulated again up to it on the new track (see seek)"""
+        if not self.up_to_date:
+            self.seek(self.frame)
+        for _ in range(n):
+            queried_cells = set()
+            self.world.step_forward([self.rider], self.track, self.record_collisions, queried_cells)
+            self.frame += 1
+            for cell in queried_cells:
+                self.cell_first_frame.setdefault(cell, self.frame)
+            if self.timeline.wants(self.frame):
+                self.timeline.record(self.frame, self.rider.get_state())
+        self.max_frame = max(self.max_frame, self.frame)
+        return self.rider
+
+    def seek(self, frame: int):
+        """Puts the rider at the given frame, replaying from the closest checkpoint before it
+        (or from the current frame, if that is closer)"""
+        frame = max(0, frame)
+        if frame == self.frame and self.up_to_date:
+            return self.rider
+        checkpoint = self.timeline.latest(frame)
+        if checkpoint is None:
+            if frame < self.frame or not self.up_to_date:
+                self.reset()
+        elif not (self.up_to_date and checkpoint[0] <= self.frame <= frame):
+            self.frame, state = checkpoint
+            self.rider.set_state(state)
+            self.up_to_date = True
+        return self.step(frame - self.frame)
+
+    def reset(self, rider: Rider = None, frame: int = 0):
+        """Puts the rider back on the start point, or replaces it with the given one
+        (a flagged rider, taken at the given frame)"""
+        if rider is None:
+            rider = Rider(self.track.startPoint)
+        self.rider = rider
+        self.frame = frame
+        self.up_to_date = True
+        if frame > 0 or len(self.timeline) == 0:  # the timeline goes on from the given rider
+            self.invalidate(frame + 1)
+            self.timeline.record(frame, rider.get_state())
+            self.max_frame = frame
+
+    def track_edited(self, line):
+        """Called by the track when a line is added or removed (line is None if all lines changed)
+        Only the frames from the first one that looked up a cell of the line are simulated again"""
+        if line is None:
+            self.invalidate(1)
+        elif line.ink != Ink.Scene:  # the rider goes through scenery
+            frames = [self.cell_first_frame.get(cell) for cell in self.track.grid.get_grid_cells(line)]
+            frames = [frame for frame in frames if frame is not None]
+            if len(frames) > 0:
+                self.invalidate(min(frames))
+
+    def invalidate(self, from_frame: int):
+        """Forgets what was simulated from the given frame on"""
+        self.timeline.invalidate(from_frame)
+        if self.frame >= from_frame:
+            self.up_to_date = False
+        self.cell_first_frame = {cell: frame for cell, frame in self.cell_first_frame.items() if frame < from_frame}
+        self.max_frame = min(self.max_frame, max(self.frame, from_frame - 1))
+
+
+class BatchSimulation:
+    """Many riders on the same track, stepped together (see RiderBatch).
+    Meant for robustness testing: does the track still work when the rider starts a bit differently?
+    No timeline here, the batch only goes forward"""
+    def __init__(self, track: Track, batch: RiderBatch, world: World = None):
+        self.track = track
+        self.batch = batch
+        self.world = world if world is not None else World()
+        self.frame = 0
+        self.kill_frames = [None] * len(batch)  # frame each rider fell off the sled on, None while on it
+
+    def step(self, n: int = 1):
+        """Moves all the riders n frames forward"""
+        riders = self.batch.riders
+        for _ in range(n):
+            self.world.step_forward(riders, self.track)
+            self.frame += 1
+            for i, rider in enumerate(riders):
+                if self.kill_frames[i] is None and not rider.onSled:
+                    self.kill_frames[i] = self.frame
+        return riders
+
+    def survivors(self):
+        """Riders still on their sled"""
+        return [rider for rider in self.batch if rider.onSled]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a saved track without display')
+    parser.add_argument('track', help='path to a saved track')
+    parser.add_argument('-n', '--frames', type=int, default=1000, help='number of frames to simulate')
+    parser.add_argument('-s', '--speeds', type=float, nargs='+',
+                        help='run one rider per initial horizontal speed (pixels/frame), all at once')
+    args = parser.parse_args()
+
+    simulation = Simulation.from_payload(track_file.load_payload(args.track))
+    if args.speeds:
+        return run_batch(simulation.track, args.speeds, args.frames)
+    start = time.perf_counter()
+    simulation.step(args.frames)
+    duration = time.perf_counter() - start
+
+    rider = simulation.rider
+    print(f'{simulation.frame} frames in {duration:.2f}s ({simulation.frame / duration:.0f} fps)')
+    print(f'Rider at {rider.pos.r}, {"on" if rider.onSled else "off"} the sled, {rider.speed:.1f} pixels/frame')
+    print(f'Broad phase: {simulation.world.broadPhaseStats}')
+
+
+def run_batch(track, speeds, frames):
+    batch = RiderBatch.spread(track.startPoint, [Vector(speed, 0) for speed in speeds])
+    simulation = BatchSimulation(track, batch)
+    start = time.perf_counter()
+    simulation.step(frames)
+    duration = time.perf_counter() - start
+
+    print(f'{len(batch)} riders, {simulation.frame} frames in {duration:.2f}s '
+          f'({simulation.frame * len(batch) / duration:.0f} rider frames/s)')
+    for speed, rider, kill_frame in zip(speeds, batch, simulation.kill_frames):
+        status = 'on the sled' if kill_frame is None else f'fell off on frame {kill_frame}'
+        print(f'Speed {speed:g}: {status}, {rider.speed:.1f} pixels/frame')
+    print(f'Broad phase: {simulation.world.broadPhaseStats}')
+
+
+if __name__ == "__main__":
+    main()
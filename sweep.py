@@ -0,0 +1,115 @@
+""" In this module:
+Class SweepJob
+Class SweepResult
+
+Parameter sweeps: the same track simulated under many configurations (start point, gravity, drag,
+acceleration), spread over a process pool. Each worker builds the track once, then runs jobs on it.
+"""
+
+import argparse
+import itertools
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+
+from geometry import Vector
+from rider import Rider
+from track import Track
+from world import World
+import track_file
+
+DEFAULTS = World()
+
+
+@dataclass(frozen=True)
+class SweepJob:
+    start: tuple = None  # (x, y), the start point of the track if None
+    grav: float = DEFAULTS.grav.y
+    drag: float = DEFAULTS.drag
+    acc: float = DEFAULTS.acc
+    frames: int = 1000  # frame budget
+
+
+@dataclass(frozen=True)
+class SweepResult:
+    job: SweepJob
+    frames_survived: int  # frames completed on the sled, the whole budget if the rider never fell off
+    kill_frame: int  # frame kill_bosh fired on, None if it did not
+    max_speed: float  # pixels/frame
+
+
+_worker_track = None  # track of the current worker process, built once by init_worker
+
+
+def init_worker(payload):
+    global _worker_track
+    _worker_track = Track()
+    _worker_track.import_(payload)
+    _worker_track.freeze()
+
+
+def run_job(job: SweepJob, track: Track = None):
+    """Simulates one configuration on the given track (the worker's one by default)"""
+    track = track if track is not None else _worker_track
+    world = World(grav=job.grav, drag=job.drag, acc=job.acc)
+    rider = Rider(Vector(*job.start) if job.start is not None else track.startPoint)
+    riders = [rider]
+    kill_frame, max_speed = None, 0.0
+    for frame in range(1, job.frames + 1):
+        world.step_forward(riders, track)
+        max_speed = max(max_speed, rider.speed)
+        if kill_frame is None and not rider.onSled:
+            kill_frame = frame
+    frames_survived = kill_frame - 1 if kill_frame is not None else job.frames
+    return SweepResult(job, frames_survived, kill_frame, max_speed)
+
+
+def sweep(payload, jobs, workers: int = None):
+    """Runs the jobs on the track of the export payload (see Track.build_export_payload) over a process pool.
+    Yields the results in the order of the jobs. workers: number of processes, one per core if None"""
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(payload,)) as pool:
+        yield from pool.map(run_job, jobs, chunksize=4)
+
+
+def grid_jobs(starts=(None,), gravs=(DEFAULTS.grav.y,), drags=(DEFAULTS.drag,), accs=(DEFAULTS.acc,),
+              frames: int = 1000):
+    """All the combinations of the given parameter values"""
+    return [SweepJob(start, grav, drag, acc, frames)
+            for start, grav, drag, acc in itertools.product(starts, gravs, drags, accs)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a saved track under many physics parameters, in parallel')
+    parser.add_argument('track', help='path to a saved track')
+    parser.add_argument('-n', '--frames', type=int, default=1000, help='frame budget of each run')
+    parser.add_argument('--start', type=float, nargs=2, action='append', metavar=('X', 'Y'),
+                        help='start point, can be given several times (default: start point of the track)')
+    parser.add_argument('--grav', type=float, nargs='+', default=[DEFAULTS.grav.y])
+    parser.add_argument('--drag', type=float, nargs='+', default=[DEFAULTS.drag])
+    parser.add_argument('--acc', type=float, nargs='+', default=[DEFAULTS.acc])
+    parser.add_argument('-j', '--workers', type=int, help='number of processes (default: one per core)')
+    parser.add_argument('--pickle', help='also save the results to this file, as a list of dicts')
+    args = parser.parse_args()
+
+    payload = track_file.load_payload(args.track, lazy_tiles=False)  # sent to the workers whole
+    starts = [tuple(start) for start in args.start] if args.start else [None]
+    jobs = grid_jobs(starts, args.grav, args.drag, args.acc, args.frames)
+
+    start = time.perf_counter()
+    results = []
+    for result in sweep(payload, jobs, args.workers):
+        results.append(result)
+        job = result.job
+        status = f'fell off on frame {result.kill_frame}' if result.kill_frame is not None else 'made it'
+        print(f'start={job.start} grav={job.grav:g} drag={job.drag:g} acc={job.acc:g}: '
+              f'{status}, max speed {result.max_speed:.1f} pixels/frame')
+    print(f'{len(jobs)} runs in {time.perf_counter() - start:.2f}s')
+
+    if args.pickle:
+        with open(args.pickle, 'wb') as output:
+            pickle.dump([asdict(result) for result in results], output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import math
+import random
+import sys
+from fractions import Fraction
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from geometry import SolidLine, Vector
+from grid import grid_cells
+from tool_helpers import Ink
+from track import Track
+
+
+def brute_force_cells(x1, y1, x2, y2, g):
+    """Cells of the points of the line, found with exact arithmetic: those of the points where it crosses grid
+    lines and of the points between. Where it goes through a corner, the two cells beside the corner too"""
+    x1, y1, x2, y2 = map(Fraction, (x1, y1, x2, y2))
+
+    def point(t):
+        return x1 + (x2 - x1) * t, y1 + (y2 - y1) * t
+
+    def cell(p):
+        return math.floor(p[0] / g) * g, math.floor(p[1] / g) * g
+
+    ts = {Fraction(0), Fraction(1)}
+    for a, b in ((x1, x2), (y1, y2)):
+        if a != b:
+            for k in range(math.floor(min(a, b) / g), math.floor(max(a, b) / g) + 1):
+                t = (k * g - a) / (b - a)
+                if 0 <= t <= 1:
+                    ts.add(t)
+    ts = sorted(ts)
+    cells = set()
+    for i, t in enumerate(ts):
+        before = cell(point((ts[i - 1] + t) / 2)) if i > 0 else cell(point(t))
+        after = cell(point((t + ts[i + 1]) / 2)) if i + 1 < len(ts) else cell(point(t))
+        cells |= {before, after, cell(point(t))}
+        x, y = point(t)
+        if x % g == 0 and y % g == 0:  # a corner
+            cells |= {(before[0], after[1]), (after[0], before[1])}
+    return cells
+
+
+def check(x1, y1, x2, y2, g):
+    cells = list(grid_cells(x1, y1, x2, y2, g))
+    assert len(cells) == len(set(cells)), (x1, y1, x2, y2)
+    assert set(cells) == brute_force_cells(x1, y1, x2, y2, g), (x1, y1, x2, y2)
+
+
+def test_corner_crossing():
+    assert (-50, 200) in set(grid_cells(175, 50, -125, 250, 50))
+    check(175, 50, -125, 250, 50)
+
+
+def test_lines_on_the_lattice():
+    rnd = random.Random(0)
+    for _ in range(5000):
+        check(*(rnd.randrange(-300, 301, 25) for _ in range(4)), 50)
+
+
+def test_random_lines():
+    rnd = random.Random(1)
+    for _ in range(2000):
+        check(*(rnd.uniform(-300, 300) for _ in range(4)), 50)
+
+
+def test_coarse_levels_follow_edits():
+    rnd = random.Random(2)
+    track = Track()
+
+    def check_levels():
+        grid = track.grid
+        assert grid.coarse_levels == grid.coarse_levels_of(grid.solids, grid.scenery)
+
+    lines = []
+    for _ in range(3000):
+        r1 = Vector(rnd.uniform(-5000, 5000), rnd.uniform(-5000, 5000))
+        r2 = r1 + Vector(rnd.uniform(-40, 40), rnd.uniform(-40, 40)) * rnd.choice([1, 1, 10, 100])
+        lines.append(SolidLine(r1, r2, rnd.choice(list(Ink))))
+    for line in lines[:1500]:
+        track.add_line(line)
+    track.add_lines(lines[1500:])
+    check_levels()
+    for line_id in range(0, 3000, 3):
+        track.remove_line(line_id)
+    check_levels()
+    track.remove_lines(list(range(1, 3000, 3)))
+    check_levels()
+
+    topleft, bottomright = Vector(-4000, -3000), Vector(3000, 4000)
+    expected = {line.id for line in track.lines
+                if any(topleft.x <= cell[0] <= bottomright.x and topleft.y <= cell[1] <= bottomright.y
+                       for cell in track.grid.get_grid_cells(line))}
+    assert expected <= track.grid.get_lines_in_box(topleft, bottomright)
@@ -0,0 +1,95 @@
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import journal
+import track_file
+from geometry import SolidLine, Vector
+from main import App
+from tool_helpers import Ink
+from track import Track
+
+
+class Session:
+    """What App.write_track_on_disk and App.load_track use of an App, without a window"""
+    def __init__(self, path):
+        self.track = Track()
+        self.journal = journal.Journal(self.track, path)
+        self.rider = self
+
+    def start_session(self):
+        pass
+
+    def rebuild(self, start_point):
+        pass
+
+    def reset_rider(self):
+        pass
+
+    journal_saved = App.journal_saved
+
+
+def line_at(x):
+    return SolidLine(Vector(x, 0), Vector(x + 20, 10), Ink.Solid)
+
+
+def xs_of(track):
+    return sorted(line.r1.x for line in track.lines)
+
+
+def test_save_as_tiled_track_then_save_edits(tmp_path):
+    tiled = tmp_path / 'a.lrt'
+    track = Track()
+    track.add_lines([line_at(0), line_at(10000)])
+    track_file.write(track, tiled, tile_spacing=track_file.TILE_SPACING)
+
+    session = Session(tiled)
+    App.load_track(session, tiled)
+    assert session.track.tiles is not None
+    session.track.add_line(line_at(50))
+    copy = tmp_path / 'b.lrt'
+    assert App.write_track_on_disk(session, copy)  # save as
+    far = next(line for line in session.track.lines if line.r1.x == 10000)
+    session.track.remove_line(far.id)
+    assert App.write_track_on_disk(session, copy)  # journal save
+    session.journal.close()
+
+    reopened = Session(tmp_path / 'other.lrt')
+    App.load_track(reopened, copy)
+    reopened.journal.close()
+    assert xs_of(reopened.track) == [0, 50]
+
+
+def test_save_does_not_wait_for_compaction(tmp_path):
+    path = tmp_path / 'a.lrt'
+    track = Track()
+    track_file.write(track, path)
+    session = Session(path)
+    App.load_track(session, path)
+    writer = session.journal
+    writer.compact_every = 1
+    compacting, resume = threading.Event(), threading.Event()
+    compact = writer.compact
+
+    def slow_compact():
+        compacting.set()
+        resume.wait()
+        compact()
+    writer.compact = slow_compact
+
+    session.track.add_line(line_at(0))
+    assert App.write_track_on_disk(session, path)
+    assert compacting.wait(5)
+    session.track.add_line(line_at(50))
+    assert App.write_track_on_disk(session, path)  # returns while the compaction holds the writer
+    assert session.track.save_statustag == "Saving..."
+    resume.set()
+    writer.close()
+    assert session.track.save_statustag == "Saved!"
+
+    reopened = Session(tmp_path / 'other.lrt')
+    App.load_track(reopened, path)
+    reopened.journal.close()
+    assert xs_of(reopened.track) == [0, 50]
@@ -0,0 +1,57 @@
+"""Memory per line of a track of pencil strokes.
+Run as a script for other sizes: python tests/test_memory.py 1000000"""
+
+import gc
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from geometry import SolidLine, Vector
+from tool_helpers import Ink
+from track import Track
+
+STORAGE = ('x1', 'y1', 'x2', 'y2', 'xmin', 'xmax', 'ymin', 'ymax', 'inks', 'directions')
+
+
+def pencil_lines(n, stroke=1000, seed=0):
+    """n lines in strokes of connected short lines, scattered over a large area"""
+    rnd = random.Random(seed)
+    lines = []
+    while len(lines) < n:
+        x, y = rnd.random() * 2e5, rnd.random() * 2e5
+        for _ in range(min(stroke, n - len(lines))):
+            x2, y2 = x + 5 + rnd.random() * 20, y + rnd.random() * 10 - 5
+            lines.append(SolidLine(Vector(x, y), Vector(x2, y2), Ink.Solid))
+            x, y = x2, y2
+    return lines
+
+
+def measure(lines):
+    """Bytes per line of the whole track (lines, grid and the IDs in it), traced while it is built from the lines,
+    and of the storage of its LineStore alone"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        track = Track()
+        track.add_lines(lines)
+        gc.collect()
+        whole = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    storage = sum(sys.getsizeof(getattr(track.lines, name)) for name in STORAGE)
+    return whole / len(lines), storage / len(lines)
+
+
+def test_memory_per_line():
+    whole, storage = measure(pencil_lines(100000))
+    assert storage < 100  # about 280 when lines were SolidLine objects made of Vectors
+    assert whole < 350  # 430 then, the grid takes most of it now
+
+
+if __name__ == '__main__':
+    lines = pencil_lines(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
+    whole, storage = measure(lines)
+    print(f'{len(lines)} lines: {whole:.0f} B/line for the whole track, {storage:.0f} B/line for the line arrays')
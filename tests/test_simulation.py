@@ -0,0 +1,87 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from geometry import SolidLine, Vector
+from rider import Rider, RiderBatch
+from simulation import BatchSimulation, Simulation
+from tool_helpers import Ink
+from track import Track
+
+
+def slope_track():
+    track = Track()
+    start = track.startPoint
+    track.add_line(SolidLine(start + Vector(-50, 50), start + Vector(3000, 900), Ink.Solid))
+    return track
+
+
+def wall(track):
+    """A line the rider hits in its first frames down the slope"""
+    start = track.startPoint
+    return SolidLine(start + Vector(60, -100), start + Vector(80, 300), Ink.Solid)
+
+
+def position(simulation):
+    return simulation.rider.pos.r.x, simulation.rider.pos.r.y
+
+
+def test_edit_then_step_then_seek():
+    track = slope_track()
+    simulation = Simulation(track)
+    simulation.step(200)
+    track.add_line(wall(track))
+    simulation.step(40)
+    stepped = position(simulation)
+    simulation.seek(0)
+    simulation.seek(240)
+
+    edited = slope_track()
+    edited.add_line(wall(edited))
+    fresh = Simulation(edited)
+    fresh.step(240)
+    assert stepped == position(simulation) == position(fresh)
+
+
+def test_edit_away_from_the_rider_keeps_the_frames():
+    track = slope_track()
+    simulation = Simulation(track)
+    simulation.step(200)
+    checkpoints = len(simulation.timeline)
+    track.add_line(SolidLine(Vector(-20000, -20000), Vector(-19900, -20000), Ink.Solid))
+    assert simulation.up_to_date and len(simulation.timeline) == checkpoints and simulation.max_frame == 200
+
+
+def test_edit_forgets_the_frames_from_the_first_that_looked_at_it():
+    track = slope_track()
+    simulation = Simulation(track)
+    simulation.step(200)
+    line = wall(track)
+    first_frame = min(simulation.cell_first_frame[cell] for cell in track.grid.get_grid_cells(line)
+                      if cell in simulation.cell_first_frame)
+    track.add_line(line)
+    assert not simulation.up_to_date
+    assert all(frame < first_frame for frame in simulation.timeline.frames)
+    assert all(frame < first_frame for frame in simulation.cell_first_frame.values())
+    assert simulation.max_frame == 200  # the rider has not moved yet
+
+
+def test_batch_riders_move_as_single_riders():
+    track = slope_track()
+    start = track.startPoint
+    track.add_lines([SolidLine(start + Vector(400, 170), start + Vector(900, 320), Ink.Acc),
+                     SolidLine(start + Vector(1200, 250), start + Vector(1300, 420), Ink.Solid)])  # a bump to fall on
+    speeds = [0, 2, 5, 10, 20]
+    batch = BatchSimulation(track, RiderBatch.spread(start, [Vector(speed, 0) for speed in speeds]))
+    batch.step(300)
+    for speed, batch_rider, kill_frame in zip(speeds, batch.batch, batch.kill_frames):
+        single = Simulation(track, Rider(start, Vector(speed, 0)))
+        fell_on = None
+        for frame in range(1, 301):
+            single.step()
+            if fell_on is None and not single.rider.onSled:
+                fell_on = frame
+        assert [(pnt.r.x, pnt.r.y) for pnt in batch_rider.points + batch_rider.scarf] == \
+            [(pnt.r.x, pnt.r.y) for pnt in single.rider.points + single.rider.scarf]
+        assert kill_frame == fell_on
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import track_file
+from geometry import SolidLine, Vector
+from rider import RiderBatch
+from simulation import BatchSimulation
+from tool_helpers import Ink
+from track import Track
+
+
+def test_riders_far_apart_keep_their_tiles(tmp_path):
+    path = tmp_path / 'two.lrt'
+    track = Track()
+    track.add_lines([SolidLine(Vector(x - 3000, 300), Vector(x + 3000, 300), Ink.Solid) for x in (0, 40000)])
+    track_file.write(track, path, tile_spacing=track_file.TILE_SPACING)
+
+    heights = []
+    for lazy_tiles in (True, False):
+        track = Track()
+        track.import_(track_file.load_payload(path, lazy_tiles=lazy_tiles))
+        if lazy_tiles:
+            track.tiles.memory_cap = 0  # only the tiles the riders need stay
+        simulation = BatchSimulation(track, RiderBatch([Vector(0, 0), Vector(40000, 0)]))
+        simulation.step(120)
+        heights.append([rider.pos.r.y for rider in simulation.batch.riders])
+    assert heights[0] == heights[1]
+    assert all(y < 300 for y in heights[0])  # both on their line
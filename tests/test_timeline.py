@@ -0,0 +1,58 @@
+import random
+import sys
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from geometry import SolidLine, Vector
+from simulation import Simulation
+from timeline import RiderState, Timeline
+from tool_helpers import Ink
+from track import Track
+
+
+def state(size=8):
+    return RiderState(array('d', [0.0] * size), True, dict())
+
+
+def positions(rider):
+    return [(pnt.r.x, pnt.r.y) for pnt in rider.points]
+
+
+def test_latest_and_invalidate():
+    timeline = Timeline(interval=10)
+    for frame in (0, 10, 20, 30):
+        timeline.record(frame, state())
+    assert timeline.latest(25)[0] == 20
+    assert timeline.latest(30)[0] == 30
+    timeline.invalidate(20)
+    assert timeline.latest(25)[0] == 10
+    assert len(timeline) == 2
+    assert timeline.wants(20) and not timeline.wants(10) and not timeline.wants(15)
+
+
+def test_budget_keeps_the_start():
+    timeline = Timeline(interval=1, budget=3 * state().size())
+    for frame in range(10):
+        timeline.record(frame, state())
+    assert len(timeline) == 3
+    assert timeline.latest(0)[0] == 0
+    assert timeline.size <= timeline.budget
+
+
+def test_seek_matches_stepping():
+    track = Track()
+    start = track.startPoint
+    track.add_lines([SolidLine(start + Vector(-50, 50), start + Vector(1500, 600), Ink.Solid),
+                     SolidLine(start + Vector(1500, 600), start + Vector(3000, 500), Ink.Acc)])
+    stepped = Simulation(track)
+    expected = [positions(stepped.rider)]
+    for _ in range(300):
+        expected.append(positions(stepped.step()))
+
+    simulation = Simulation(track, timeline=Timeline(interval=20, budget=5 * state(200).size()))
+    simulation.step(300)
+    rnd = random.Random(0)
+    for frame in [rnd.randint(0, 300) for _ in range(50)] + [300, 0, 1]:
+        assert positions(simulation.seek(frame)) == expected[frame], frame
@@ -0,0 +1,107 @@
+import pickle
+import random
+import struct
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import track_file
+from geometry import SolidLine, Vector
+from tool_helpers import Ink
+from track import Track
+
+
+def random_track(n=500, seed=0):
+    rnd = random.Random(seed)
+    track = Track()
+    lines = []
+    for _ in range(n):
+        r1 = Vector(rnd.uniform(-3000, 3000), rnd.uniform(-3000, 3000))
+        r2 = r1 + Vector(rnd.uniform(-40, 40), rnd.uniform(-40, 40)) * rnd.choice([1, 1, 10])
+        lines.append(SolidLine(r1, r2, rnd.choice(list(Ink))))
+    track.add_lines(lines)
+    for line_id in range(0, n, 7):  # free IDs in the middle
+        track.remove_line(line_id)
+    track.startPoint = Vector(12.5, -40)
+    return track
+
+
+def lines_of(track, with_ids=True):
+    return sorted(((line.id,) if with_ids else ()) + (line.r1.x, line.r1.y, line.r2.x, line.r2.y, line.ink.value)
+                  for line in track.lines)
+
+
+def loaded(path, **options):
+    track = Track()
+    track.import_(track_file.read(path, **options))
+    return track
+
+
+def test_round_trip(tmp_path):
+    track = random_track()
+    for with_grid in (True, False):
+        path = tmp_path / f'{with_grid}.lrt'
+        track_file.write(track, path, with_grid=with_grid)
+        for use_mmap in (True, False):
+            copy = loaded(path, use_mmap=use_mmap)
+            assert lines_of(copy) == lines_of(track)
+            assert (copy.startPoint.x, copy.startPoint.y) == (12.5, -40)
+            assert copy.grid.solids == track.grid.solids and copy.grid.scenery == track.grid.scenery
+
+
+def test_tiled_round_trip(tmp_path):
+    track = random_track()
+    path = tmp_path / 'tiled.lrt'
+    track_file.write(track, path, tile_spacing=track_file.TILE_SPACING)
+    copy = loaded(path, lazy_tiles=False)
+    assert lines_of(copy, with_ids=False) == lines_of(track, with_ids=False)  # renumbered tile by tile
+    grid = copy.grid
+    solids, scenery = dict(grid.solids), dict(grid.scenery)
+    grid.reset_grid()
+    assert solids == grid.solids and scenery == grid.scenery
+
+    path = tmp_path / 'kept.lrt'
+    track_file.write(track, path, tile_spacing=track_file.TILE_SPACING, keep_ids=True)
+    lazy = loaded(path)
+    lazy.tiles.load_all()
+    assert lines_of(lazy) == lines_of(track)
+    assert lazy.grid.solids == track.grid.solids and lazy.grid.scenery == track.grid.scenery
+
+
+def test_newer_version_is_refused(tmp_path):
+    path = tmp_path / 'new.lrt'
+    track_file.write(random_track(10), path)
+    data = bytearray(path.read_bytes())
+    struct.pack_into('<H', data, len(track_file.MAGIC), track_file.VERSION + 1)
+    path.write_bytes(data)
+    try:
+        track_file.read(path)
+    except ValueError as error:
+        assert 'newer' in str(error)
+    else:
+        assert False, 'read a file of a newer version'
+
+
+def test_convert_pickled_track(tmp_path):
+    track = random_track()
+    pickled = tmp_path / 'old_track'
+    with open(pickled, 'wb') as file:
+        pickle.dump(track.build_export_payload(), file)
+    copy = loaded(track_file.convert(pickled))
+    assert lines_of(copy, with_ids=False) == lines_of(track, with_ids=False)
+
+
+def test_sharded_grid_of_mapped_track(tmp_path):
+    path = tmp_path / 'track.lrt'
+    track_file.write(random_track(), path, with_grid=False)
+    tracks = []
+    for workers in (None, 2):
+        track = Track()
+        track.import_(track_file.load_payload(path), workers=workers)
+        assert isinstance(track.lines.x1, memoryview)  # still reading the mapped file
+        tracks.append(track)
+    mapped, sharded = tracks[0].grid, tracks[1].grid
+    sharded.reset_grid(workers=2, chunk_size=64)
+    assert sharded.solids == mapped.solids and sharded.scenery == mapped.scenery
+    assert sharded.coarse_levels == mapped.coarse_levels
@@ -0,0 +1,28 @@
+import copy
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from geometry import SolidLine, Vector
+from rider import Rider
+from tool_helpers import Ink
+from track import Track
+from world import World
+
+
+def test_step_after_erasing_a_touched_acceleration_line():
+    track = Track()
+    start = track.startPoint
+    acc_line = SolidLine(start + Vector(-50, 50), start + Vector(3000, 900), Ink.Acc)
+    track.add_line(acc_line)
+    world, rider = World(), Rider(start)
+    while not rider.accQueueNow:
+        world.step_forward([rider], track)
+    track.remove_line(acc_line.id)
+    expected = copy.deepcopy(rider)
+    expected.accQueueNow = dict()
+
+    world.step_forward([rider], track)  # the erased line no longer pushes the rider
+    world.step_forward([expected], track)
+    assert [(pnt.r.x, pnt.r.y) for pnt in rider.points] == [(pnt.r.x, pnt.r.y) for pnt in expected.points]
@@ -0,0 +1,118 @@
+""" In this module:
+Class TileCache
+
+Lazy loading of tiled track files (see track_file.write), for tracks too large to keep indexed in memory.
+"""
+
+import sys
+from collections import OrderedDict
+
+from grid import coarse_cells
+
+CELL_BYTES = 150  # dict slot, key tuple and its two ints, besides the set of line IDs
+ID_BYTES = 28  # int of a line ID, besides its slot in the set
+
+
+class TileCache:
+    """Tiles of a tiled track file, loaded into the grid of the track as they are needed.
+    A tile is a square of spacing pixels, keyed like a grid cell. The cells of a tile are read from the file when
+    a box looked at (the viewport, the region swept by a rider) comes within margin of it, and the least recently
+    used tiles are dropped once the cells in memory take more than memory_cap bytes (an estimate).
+    The endpoints of the lines stay in the mapped file: those of a dropped tile are given back to the system.
+    Tiles are made of whole cells of every grid level, so loading or dropping one never splits a cell.
+    A tile with edited lines is pinned, never dropped, since the file does not have the edits.
+    index: the TileIndex of the file, see track_file.read"""
+    def __init__(self, track, index, memory_cap: int = 128 * 2 ** 20, margin: float = None):
+        self.track = track
+        self.index = index
+        self.spacing = index.spacing
+        self.memory_cap = memory_cap
+        self.margin = margin if margin is not None else self.spacing / 4
+        self.resident = OrderedDict()  # tile -> (solid cells, scenery cells, bytes), least recently used first
+        self.pinned = set()
+        self.memory = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return (f'TileCache({len(self.resident)} of {len(self.index)} tiles, {self.memory / 2 ** 20:.1f} MB, '
+                f'{self.loads} loads, {self.evictions} evictions)')
+
+    def tile_of(self, x, y):
+        return int(x - x % self.spacing), int(y - y % self.spacing)
+
+    def tiles_in_box(self, topleft, bottomright):
+        """Tiles of the file within margin of the box"""
+        left, top = self.tile_of(topleft.x - self.margin, topleft.y - self.margin)
+        right, bottom = self.tile_of(bottomright.x + self.margin, bottomright.y + self.margin)
+        t = self.spacing
+        return [(x, y) for x in range(left, right + t, t) for y in range(top, bottom + t, t) if (x, y) in self.index]
+
+    def load_box(self, topleft, bottomright):
+        """Makes sure the tiles around the box are in the grid, then drops old ones if over the cap.
+        Returns whether the grid changed"""
+        return self.load_boxes([(topleft, bottomright)])
+
+    def load_boxes(self, boxes):
+        """Same as load_box for (topleft, bottomright) boxes looked at together, as the regions of several riders:
+        none of their tiles is dropped for another's"""
+        tiles = list({tile: None for box in boxes for tile in self.tiles_in_box(*box)})
+        loaded = False
+        for tile in tiles:
+            if tile in self.resident:
+                self.resident.move_to_end(tile)
+            else:
+                self.load(tile)
+                loaded = True
+        return self.trim(keep=tiles) or loaded
+
+    def load_all(self):
+        """Brings every tile in, whatever the cap, as when the whole track is saved"""
+        for tile in self.index:
+            if tile not in self.resident:
+                self.load(tile)
+
+    def pin(self, line):
+        """Loads and keeps the tiles the line goes through, before it is added or removed"""
+        grid = self.track.grid
+        for tile in coarse_cells(grid.get_grid_cells(line), self.spacing):
+            if tile in self.index and tile not in self.resident:
+                self.load(tile)
+            self.pinned.add(tile)
+
+    def load(self, tile):
+        grid = self.track.grid
+        solids, scenery = self.index.read_cells(tile)
+        grid.add_cells(solids, scenery)
+        cells = set(solids) | set(scenery)
+        memory = cells_memory(list(solids.values()) + list(scenery.values()))
+        for coarse_grid, spacing in zip(grid.coarse_levels, grid.level_spacings[1:]):
+            memory += cells_memory([coarse_grid[cell] for cell in coarse_cells(cells, spacing)], id_bytes=0)
+        self.resident[tile] = list(solids), list(scenery), memory
+        self.memory += memory
+        self.loads += 1
+
+    def evict(self, tile):
+        solid_cells, scenery_cells, memory = self.resident.pop(tile)
+        self.track.grid.remove_cells(solid_cells, scenery_cells)
+        self.index.release_lines(tile)
+        self.memory -= memory
+        self.evictions += 1
+
+    def trim(self, keep=()):
+        """Drops the least recently used tiles, but those to keep and the pinned ones, until under the cap.
+        Returns whether any was dropped"""
+        evicted = False
+        for tile in list(self.resident):
+            if self.memory <= self.memory_cap:
+                break
+            if tile not in keep and tile not in self.pinned:
+                self.evict(tile)
+                evicted = True
+        return evicted
+
+
+def cells_memory(cells, id_bytes: int = ID_BYTES):
+    """Estimated bytes of grid cells, from their sets of line IDs.
+    id_bytes: bytes of an item besides its slot, none for coarse cells whose items are the keys of finer cells"""
+    return sum(sys.getsizeof(items) + CELL_BYTES + id_bytes * len(items) for items in cells)
@@ -0,0 +1,75 @@
+""" In this module:
+Class RiderState
+Class Timeline
+"""
+
+import bisect
+import sys
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass
+class RiderState:
+    """Compact copy of what the physics needs to carry on a rider from a given frame"""
+    coords: array  # x, y, x0, y0 of all the points, one after the other
+    on_sled: bool
+    acc_queue: dict  # point index -> IDs of acceleration lines, taking effect next frame
+
+    def size(self):
+        """Approximate memory footprint, in bytes"""
+        return sys.getsizeof(self.coords) + sys.getsizeof(self.acc_queue) + 100
+
+
+class Timeline:
+    """Checkpoints of the rider state every `interval` frames, kept under a memory budget.
+    When over budget, the least recently used checkpoints are evicted, except the one of frame 0
+    which is always there to replay from."""
+    def __init__(self, interval: int = 20, budget: int = 16 * 2 ** 20):
+        self.interval = interval
+        self.budget = budget  # bytes
+        self.checkpoints = OrderedDict()  # frame -> RiderState, least recently used first
+        self.frames = []  # checkpointed frames, sorted
+        self.size = 0
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    def wants(self, frame: int):
+        """Whether a checkpoint should be recorded on this frame"""
+        return frame % self.interval == 0 and frame not in self.checkpoints
+
+    def record(self, frame: int, state: RiderState):
+        if frame in self.checkpoints:
+            self.size -= self.checkpoints.pop(frame).size()
+        else:
+            bisect.insort(self.frames, frame)
+        self.checkpoints[frame] = state
+        self.size += state.size()
+        self.evict()
+
+    def latest(self, frame: int):
+        """The last checkpoint at or before the given frame, as (frame, state)"""
+        i = bisect.bisect_right(self.frames, frame)
+        if i == 0:
+            return None
+        checkpoint_frame = self.frames[i - 1]
+        self.checkpoints.move_to_end(checkpoint_frame)
+        return checkpoint_frame, self.checkpoints[checkpoint_frame]
+
+    def invalidate(self, from_frame: int):
+        """Forgets the checkpoints of the given frame and after"""
+        i = bisect.bisect_left(self.frames, from_frame)
+        for frame in self.frames[i:]:
+            self.size -= self.checkpoints.pop(frame).size()
+        del self.frames[i:]
+
+    def evict(self):
+        while self.size > self.budget and len(self.checkpoints) > 1:
+            frame = next(iter(self.checkpoints))
+            if frame == 0:  # never evict the start
+                self.checkpoints.move_to_end(0)
+                frame = next(iter(self.checkpoints))
+            self.size -= self.checkpoints.pop(frame).size()
+            self.frames.remove(frame)
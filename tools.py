@@ -59,19 +59,22 @@ class Pencil:
         self.temp_point = None
 
     def use(self, event):
+        """A stroke, from press to release, is one edit of the history"""
         pos = Vector(event.x, event.y)
-        if self.tm.app.player.is_paused and self.tm.app.player.in_window(pos):
+        if event.type == "5":  # released, wherever
+            self.temp_point = None
+            self.tm.app.history.commit()
+        elif self.tm.app.player.is_paused and self.tm.app.player.in_window(pos):
             pos = self.tm.app.player.inverse_pz(pos)
             if event.type == "4":  # pressed
                 self.temp_point = pos
+                self.tm.app.history.begin()
             elif event.type == "6" and self.temp_point is not None:  # moved
                 min_len = self.tm.app.player.snap_radius / self.tm.app.player.zoom
                 if distance(self.temp_point, pos) > min_len:  # to avoid making lines of 0 length
                     line = SolidLine(self.temp_point, pos, self.tm.ink)
                     self.tm.app.track.add_line(line)
                     self.temp_point = pos
-            elif event.type == "5":
-                self.temp_point = None
 
 
 class Ruler:
@@ -105,14 +108,17 @@ class Eraser:
         self.radius = radius
 
     def use(self, event):
+        """A drag, from press to release, is one edit of the history"""
         pos = Vector(event.x, event.y)
-        if self.tm.app.player.is_paused and event.type != "5" and self.tm.app.player.in_window(pos):  # on press and move
+        if event.type == "5":  # released, wherever
+            self.tm.app.history.commit()
+        elif self.tm.app.player.is_paused and self.tm.app.player.in_window(pos):  # on press and move
+            if event.type == "4":
+                self.tm.app.history.begin()
             pos = self.tm.app.player.inverse_pz(pos)
-            removed_lines = self.tm.app.world.get_lines_around(pos, self.radius)
+            removed_lines = self.tm.app.track.get_lines_around(pos, self.radius)
             if len(removed_lines) > 0:
-                for line in removed_lines:
-                    if line in self.tm.app.track.lines:
-                        self.tm.app.track.remove_line(line)
+                self.tm.app.track.remove_lines([line.id for line in removed_lines])
 
 
 class Pan:
@@ -127,7 +133,7 @@ class Pan:
             # elif event.type == "5":  # released
             #     pass
             elif event.type == "6":  # moved
-                pan = Vector(self.tempCam) - Vector(pos)
+                pan = Vector(*self.tempCam) - Vector(*pos)
                 self.tm.app.player.panPos += pan / self.tm.app.player.zoom
                 self.tempCam = pos
 
@@ -7,23 +7,37 @@ TODO: Export grid coords to UI so that UI only draw lines (player requests UI to
 
 import datetime
 
+from chains import Chains
 from grid import Grid
+from compiled_grid import CompiledGrid
+from line_store import LineStore
+from tile_cache import TileCache
 from geometry import Vector, distance, Line
 
 
 class Track:
-    def __init__(self, app):
+    def __init__(self, app=None):
+        """app is optional: a track without app can be simulated but keeps no edit history"""
         self.app = app
         self._name = f'Untitled, created on {datetime.datetime.now():%Y-%m-%d at %H-%M-%S}'
         self.orig_name = True
         self.save_statustag = ''
-        self.lines = []
+        self.lines = LineStore()
         self.edits_not_saved = False
         self.startPoint = Vector(0, 0)
 
         self.grid = Grid(track=self)
+        self.compiled_grid = None  # read-only copy of the grid for physics while frozen, see freeze()
+        self.tiles = None  # TileCache of a tiled track file: the grid only has the tiles around, see load_region()
+        self.edit_listeners = []  # callables, called with the line added or removed
+        self._chains = None  # see chains
 
-        self.imexport_attrs = ('lines', )
+    @property
+    def chains(self):
+        """Chains of connected lines, built on first use (simulations never need them), then kept up to date"""
+        if self._chains is None:
+            self._chains = Chains(self.lines)
+        return self._chains
 
     @property
     def name(self):
@@ -38,23 +52,112 @@ class Track:
         self.edits_not_saved = edits_not_saved
         self.save_statustag = '*' if self.edits_not_saved else ''
 
+    @property
+    def collision_grid(self):
+        """The grid physics should look solid lines up in"""
+        return self.compiled_grid if self.compiled_grid is not None else self.grid
+
+    def freeze(self):
+        """Compiles the grid for physics, while the track is not going to change (the rider plays)"""
+        if self.compiled_grid is None:
+            self.compiled_grid = CompiledGrid(self.grid)
+
+    def unfreeze(self):
+        self.compiled_grid = None
+
+    def load_region(self, topleft, bottomright):
+        """On a tiled track, brings the tiles around the box into the grid (see TileCache).
+        A compiled grid is compiled again if the grid changed"""
+        self.load_regions([(topleft, bottomright)])
+
+    def load_regions(self, boxes):
+        """Same as load_region for (topleft, bottomright) boxes that have to be in the grid together"""
+        if self.tiles is not None and self.tiles.load_boxes(boxes) and self.compiled_grid is not None:
+            self.compiled_grid = CompiledGrid(self.grid)
+
+    def load_around(self, point_groups):
+        """On a tiled track, brings the tiles around the regions swept by groups of points (one per rider) into
+        the grid, all of them at once"""
+        if self.tiles is None:
+            return
+        boxes = []
+        for points in point_groups:
+            xs = [x for pnt in points for x in (pnt.r.x, pnt.r0.x)]
+            ys = [y for pnt in points for y in (pnt.r.y, pnt.r0.y)]
+            boxes.append((Vector(min(xs), min(ys)), Vector(max(xs), max(ys))))
+        self.load_regions(boxes)
+
     def add_line(self, line, undo=False, redo=False):
         """Adds a single line to the track"""
+        self.unfreeze()
         # startPoint is to ensure rider always starts 30px above first line pixel! Disabled.
         # if len(self.lines) == 0:
         #     self.startPoint = line.r1 - Vector(0, 30)
         #     self.app.rider.rebuild(self.startPoint)
-        self.lines += [line]
+        if self.tiles is not None:
+            self.tiles.pin(line)
+        self.lines.add(line)
+        if self._chains is not None:
+            self._chains.add(line.id)
         self.grid.add_to_grid(line)
-        inverse = (line, self.remove_line)
-        self.app.add_to_history(inverse, undo, redo)
+        self.notify_edit(line)
+        if self.app is not None:
+            inverse = ([line.id], self.remove_lines)
+            self.app.add_to_history(inverse, undo, redo)
+
+    def add_lines(self, lines, undo=False, redo=False):
+        """Adds many lines at once, with a single update of the grid, as one edit of the history"""
+        lines = list(lines)
+        self.unfreeze()
+        if self.tiles is not None:
+            for line in lines:
+                self.tiles.pin(line)
+        self.lines.add_all(lines)
+        if self._chains is not None:
+            for line in lines:
+                self._chains.add(line.id)
+        self.grid.add_lines(lines)
+        for line in lines:
+            self.notify_edit(line)
+        if self.app is not None:
+            inverse = ([line.id for line in lines], self.remove_lines)
+            self.app.add_to_history(inverse, undo, redo)
 
-    def remove_line(self, line, undo=False, redo=False):
-        """Removes a single line from the track"""
-        self.lines.remove(line)
+    def remove_line(self, line_id, undo=False, redo=False):
+        """Removes a single line from the track. The line keeps its ID, should it come back"""
+        self.unfreeze()
+        line = self.lines.remove(line_id)
+        if self._chains is not None:
+            self._chains.remove(line_id)
+        if self.tiles is not None:
+            self.tiles.pin(line)
         self.grid.remove_from_grid(line)
-        inverse = (line, self.add_line)
-        self.app.add_to_history(inverse, undo, redo)
+        self.notify_edit(line)
+        if self.app is not None:
+            inverse = ([line], self.add_lines)
+            self.app.add_to_history(inverse, undo, redo)
+
+    def remove_lines(self, line_ids, undo=False, redo=False):
+        """Removes many lines at once, with a single update of the grid, as one edit of the history"""
+        self.unfreeze()
+        lines = [self.lines.remove(line_id) for line_id in line_ids]
+        if self._chains is not None:
+            for line in lines:
+                self._chains.remove(line.id)
+        if self.tiles is not None:
+            for line in lines:
+                self.tiles.pin(line)
+        self.grid.remove_lines(lines)
+        for line in lines:
+            self.notify_edit(line)
+        if self.app is not None:
+            inverse = (lines, self.add_lines)
+            self.app.add_to_history(inverse, undo, redo)
+
+    def notify_edit(self, line):
+        """line is None when the whole track changed"""
+        for listener in self.edit_listeners:
+            listener(line)
 
     def get_closest_segment_end(self, pos):
         """finds the closest endpoint of a line segment to a given point"""
@@ -86,7 +189,7 @@ class Track:
                 for y in range(topleft_cell[1], bottomright_cell[1], self.grid.spacing)
             ]
             drawing_data['grid_cells_with_lines'] = [
-                (Vector(cell), Vector(cell) + Vector(self.grid.spacing, self.grid.spacing))
+                (Vector(*cell), Vector(*cell) + Vector(self.grid.spacing, self.grid.spacing))
                 for cell in self.app.track.grid.solids
             ]
             drawing_data['grid_cells_with_rider'] = []
@@ -94,8 +197,8 @@ class Track:
                 velLine = Line(point.r, point.r + (point.r - point.r0))
                 drawing_data['grid_cells_with_rider'].extend([
                     (
-                        Vector(cell),
-                        Vector(cell) + Vector(self.grid.spacing, self.grid.spacing),
+                        Vector(*cell),
+                        Vector(*cell) + Vector(self.grid.spacing, self.grid.spacing),
                         'green' if cell in self.app.track.grid.solids else 'cyan'
                     )
                     for cell in self.app.track.grid.get_grid_cells(velLine)
@@ -104,38 +207,56 @@ class Track:
         return drawing_data
 
     def get_lines_between(self, canvas_topleft, canvas_bottomright):
-        lines = set()
-        for gPos in self.grid.grid_in_screen(canvas_topleft, canvas_bottomright):
-            lines.update(self.grid.solids.get(gPos, {None}))
-            lines.update(self.grid.scenery.get(gPos, {None}))
-        return {line for line in lines if line is not None}
+        """Returns the set of lines whose bounding box overlaps the given box"""
+        return {self.lines[line_id] for line_id in self.get_line_ids_between(canvas_topleft, canvas_bottomright)}
+
+    def get_line_ids_between(self, canvas_topleft, canvas_bottomright):
+        """Returns the set of IDs of the lines whose bounding box overlaps the given box"""
+        self.load_region(canvas_topleft, canvas_bottomright)
+        lines = self.lines
+        return {
+            line_id
+            for line_id in self.grid.get_lines_in_box(canvas_topleft, canvas_bottomright)
+            if lines.xmin[line_id] <= canvas_bottomright.x and lines.xmax[line_id] >= canvas_topleft.x
+            and lines.ymin[line_id] <= canvas_bottomright.y and lines.ymax[line_id] >= canvas_topleft.y
+        }
 
     def get_lines_around(self, pos, radius):
-        """Returns a set of lines to be removed, part of the eraser"""
+        """Returns a set of lines to be removed, part of the eraser. radius is in pixels on screen"""
         lines_found = set()
-        cells = self.grid.grid_neighbors(pos)  # list of 9 closest cell positions
-        for gPos in cells:  # each cell has a position/key on the grid/dict
-            cell = self.grid.solids.get(gPos, set())  # each cell is a set of lines
-            for line in cell:
-                if self.app.world.distance_from_line(pos, line) * self.app.player.zoom <= radius:
-                    lines_found.add(line)
-            cell = self.grid.scenery.get(gPos, set())
-            for line in cell:
-                if self.app.world.distance_from_line(pos, line) * self.app.player.zoom <= radius:
-                    lines_found.add(line)
+        reach = Vector(radius, radius) / self.app.player.zoom
+        self.load_region(pos - reach, pos + reach)
+        for line_id in self.grid.get_lines_in_box(pos - reach, pos + reach):
+            line = self.lines[line_id]
+            if self.app.world.distance_from_line(pos, line) * self.app.player.zoom <= radius:
+                lines_found.add(line)
         return lines_found
 
     # Loading and saving
-    def import_(self, dict):
+    def import_(self, dict, workers: int = None):
+        """dict: export payload (see build_export_payload), or the content of a track file (see track_file.read)
+        workers: number of processes to build the grid with, for very large tracks (see Grid.reset_grid)"""
         # TODO: Implement restauring previous track upon fail saving
         # backupLines = self.lines
         # backupStart = self.startPoint
 
+        edit_listeners = self.edit_listeners
         self.__init__(self.app)
-        for attr, val in dict.items():
-            exec(f'self.{attr} = val')
-        self.grid.reset_grid()
+        self.edit_listeners = edit_listeners
+        lines = dict['lines']  # lines keep the IDs they were saved with
+        self.lines = lines if isinstance(lines, LineStore) else LineStore(lines)
+        if 'start' in dict:
+            self.startPoint = Vector(*dict['start'])
+        grid = dict.get('grid')  # cells saved with the track, see track_file
+        tiles = dict.get('tiles')
+        if tiles is not None and tiles.fits(self.grid):
+            self.tiles = TileCache(self, tiles)  # the grid starts empty, tiles come in as they are looked at
+        elif grid is not None and grid['spacing'] == self.grid.spacing:
+            self.grid.load_cells(grid['solids'], grid['scenery'])
+        else:
+            self.grid.reset_grid(workers)
+        self.notify_edit(None)
         return True
 
     def build_export_payload(self):
-        return {attr: eval(f'self.{attr}') for attr in self.imexport_attrs}
+        return {'lines': list(self.lines)}
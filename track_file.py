@@ -0,0 +1,300 @@
+""" In this module:
+Class Reader
+Class TileIndex
+
+Track files, version 1. Binary, little-endian, every section aligned on 8 bytes:
+    header: magic b'LRTK', version (uint16), flags (uint16), number of line IDs n (uint64), start point (2 doubles)
+    lines: x1, y1, x2, y2 (n doubles each), then inks (n int8, index in line_store.INKS, -1 for a free ID)
+    grid, if flags & FLAG_GRID: spacing (uint64), then the solid cells and the scenery cells of level 0, each as
+        number of cells m and of entries e (uint64), cell x and y (m int64 each), offsets (m + 1 int64), and
+        line IDs (e int64): the lines of cell k are those from offsets[k] to offsets[k + 1]
+    tiles, if flags & FLAG_TILES (never with FLAG_GRID): grid spacing, tile spacing and number of tiles t (uint64),
+        the boxes of the lines xmin, xmax, ymin, ymax (n doubles each), the tile x and y, first and end line IDs,
+        and byte offset of the cells of each tile (t int64 each), then the cells of the tiles, solid then scenery
+        cells of each one as in the grid section. Lines are numbered tile by tile, by the tile of their first end:
+        the lines of a tile are those from its first to its end line ID (unless saved with keep_ids: first = end).
+Lines are indexed by ID, so a file is read without building any line: the arrays are views on the mapped file.
+Tiled files are for tracks too large for memory: their tiles are read on demand (see TileCache).
+Older tracks are pickled export payloads (see Track.build_export_payload), converted by running this module.
+"""
+
+import argparse
+import io
+import mmap
+import os
+import pickle
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+from line_store import LineStore
+from track import Track
+
+MAGIC = b'LRTK'
+VERSION = 1
+FLAG_GRID = 1
+FLAG_TILES = 2
+HEADER = struct.Struct('<4sHHQdd')
+COUNTS = struct.Struct('<QQ')
+SPACING = struct.Struct('<Q')
+TILES = struct.Struct('<QQQ')
+TILE_SPACING = 6400
+
+
+def write(track, path, with_grid: bool = True, tile_spacing: int = None, keep_ids: bool = False):
+    """Saves the lines and start point of the track, and the cells of its grid if with_grid.
+    tile_spacing: if given, the cells are saved tile by tile instead, and lines are numbered again tile by tile,
+    unless keep_ids (as when lines are addressed by ID, see Journal).
+    A tiled track is saved tiled, with the same tiles, unless told otherwise.
+    The file is written next to the path then moved there, so that a crash never leaves half a track"""
+    lines, grid = track.lines, track.grid
+    lines.own_arrays()  # the track may have been read from the file about to be replaced
+    if track.tiles is not None:
+        track.tiles.load_all()  # all the cells are saved
+        tile_spacing = tile_spacing if tile_spacing is not None else track.tiles.spacing
+    if tile_spacing is not None:
+        if tile_spacing % grid.level_spacings[-1]:
+            raise ValueError(f'tile spacing {tile_spacing} is not a multiple of the largest grid cells')
+        tile_of = lambda x, y: (int(x - x % tile_spacing), int(y - y % tile_spacing))
+    if tile_spacing is not None and not keep_ids:
+        ids = sorted(lines.ids(), key=lambda line_id: tile_of(lines.x1[line_id], lines.y1[line_id]))
+    else:
+        ids = range(lines.next_id)
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as file:
+        flags = FLAG_TILES if tile_spacing is not None else FLAG_GRID if with_grid else 0
+        file.write(HEADER.pack(MAGIC, VERSION, flags, len(ids), track.startPoint.x, track.startPoint.y))
+        for coords in (lines.x1, lines.y1, lines.x2, lines.y2):
+            write_array(file, array('d', (coords[line_id] for line_id in ids)))
+        write_array(file, array('b', (lines.inks[line_id] for line_id in ids)))
+        if tile_spacing is not None:
+            write_tiles(file, track, ids, tile_of, tile_spacing, renumbered=not keep_ids)
+        elif with_grid:
+            file.write(SPACING.pack(grid.spacing))
+            for cells in (grid.solids, grid.scenery):
+                write_cells(file, cells)
+    os.replace(temp_path, path)
+
+
+def write_tiles(file, track, ids, tile_of, tile_spacing, renumbered: bool = True):
+    """Tiles section: ids are the IDs of the lines in the order they are saved, tile by tile if renumbered"""
+    lines, grid = track.lines, track.grid
+    tiles = dict()  # tile -> [solid cells, scenery cells, first line ID, end line ID]
+    if renumbered:
+        new_ids = {line_id: new_id for new_id, line_id in enumerate(ids)}
+        for new_id, line_id in enumerate(ids):
+            tile = tiles.setdefault(tile_of(lines.x1[line_id], lines.y1[line_id]), [dict(), dict(), new_id, new_id])
+            tile[3] = new_id + 1
+    for k, cells in enumerate((grid.solids, grid.scenery)):
+        for (x, y), line_ids in cells.items():
+            tile = tiles.setdefault(tile_of(x, y), [dict(), dict(), 0, 0])
+            tile[k][x, y] = {new_ids[line_id] for line_id in line_ids} if renumbered else line_ids
+
+    sections = []
+    for solids, scenery, _, _ in tiles.values():
+        section = io.BytesIO()
+        write_cells(section, solids)
+        write_cells(section, scenery)
+        sections.append(section.getvalue())
+    file.write(TILES.pack(grid.spacing, tile_spacing, len(tiles)))
+    for coords in (lines.xmin, lines.xmax, lines.ymin, lines.ymax):
+        write_array(file, array('d', (coords[line_id] for line_id in ids)))
+    offset = file.tell() + 8 * 5 * len(tiles)  # after the directory
+    offsets = array('q')
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    for column in range(2):
+        write_array(file, array('q', (tile[column] for tile in tiles)))
+    for column in (2, 3):
+        write_array(file, array('q', (tile[column] for tile in tiles.values())))
+    write_array(file, offsets)
+    for section in sections:
+        file.write(section)
+
+
+def write_cells(file, cells):
+    xs, ys, offsets, line_ids = array('q'), array('q'), array('q', [0]), array('q')
+    for (x, y), cell_line_ids in cells.items():
+        xs.append(x)
+        ys.append(y)
+        line_ids.extend(sorted(cell_line_ids))
+        offsets.append(len(line_ids))
+    file.write(COUNTS.pack(len(xs), len(line_ids)))
+    for values in (xs, ys, offsets, line_ids):
+        write_array(file, values)
+
+
+def write_array(file, values: array):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    data = values.tobytes()
+    file.write(data + bytes(-len(data) % 8))
+
+
+class Reader:
+    """Reads the sections of a file one after the other, as views on its bytes"""
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, layout: struct.Struct):
+        values = layout.unpack_from(self.data, self.offset)
+        self.offset += layout.size
+        return values
+
+    def array(self, typecode, length):
+        """Next length values, without copy when the byte order allows it"""
+        size = array(typecode).itemsize * length
+        view = self.data[self.offset:self.offset + size]
+        self.offset += size + (-size % 8)
+        if sys.byteorder == 'little':
+            return view.cast(typecode)
+        values = array(typecode, view.tobytes())
+        values.byteswap()
+        return values
+
+
+class TileIndex:
+    """Where the tiles of a tiled file are: the cells of each tile and its lines, read by a TileCache"""
+    def __init__(self, data, grid_spacing, spacing, tiles, line_sections):
+        self.data = data
+        self.grid_spacing = grid_spacing
+        self.spacing = spacing
+        self.tiles = tiles  # tile -> (offset of its cells, first line ID, end line ID)
+        self.line_sections = line_sections  # (offset, item size) of each array indexed by line ID
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __iter__(self):
+        return iter(self.tiles)
+
+    def __contains__(self, tile):
+        return tile in self.tiles
+
+    def fits(self, grid):
+        """Whether the tiles can be loaded into the grid: same cells, tiles made of its largest cells"""
+        return self.grid_spacing == grid.spacing and self.spacing % grid.level_spacings[-1] == 0
+
+    def read_cells(self, tile):
+        """Solid and scenery cells of the tile"""
+        reader = Reader(self.data)
+        reader.offset = self.tiles[tile][0]
+        return read_cells(reader), read_cells(reader)
+
+    def release_lines(self, tile):
+        """Lets the system drop the pages of the lines of the tile from memory, until they are read again"""
+        if not isinstance(self.data, mmap.mmap) or not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        _, first, end = self.tiles[tile]
+        for offset, itemsize in self.line_sections:
+            start = offset + first * itemsize
+            start += -start % mmap.PAGESIZE  # whole pages only, the others hold lines of other tiles
+            stop = offset + end * itemsize
+            stop -= stop % mmap.PAGESIZE
+            if stop > start:
+                self.data.madvise(mmap.MADV_DONTNEED, start, stop - start)
+
+
+def read(path, use_mmap: bool = True, lazy_tiles: bool = True):
+    """Reads a track file into a payload for Track.import_: lines (a LineStore), start point and grid cells.
+    With use_mmap, the endpoints and inks stay in the mapped file, loaded by the system as they are read.
+    The tiles of a tiled file are left in the file with lazy_tiles (payload 'tiles', a TileIndex),
+    otherwise their cells are all read as the grid"""
+    with open(path, 'rb') as file:
+        if use_mmap:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = file.read()
+    reader = Reader(data)
+    magic, version, flags, n, start_x, start_y = reader.unpack(HEADER)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a track file')
+    if version > VERSION:
+        raise ValueError(f'{path} is a track file of version {version}, newer than this program (version {VERSION})')
+
+    line_sections = []
+    coords = []
+    for typecode in 'ddddb':
+        line_sections.append((reader.offset, array(typecode).itemsize))
+        coords.append(reader.array(typecode, n))
+    payload = {'start': (start_x, start_y)}
+    if flags & FLAG_GRID:
+        spacing, = reader.unpack(SPACING)
+        payload['grid'] = {'spacing': spacing, 'solids': read_cells(reader), 'scenery': read_cells(reader)}
+    if not flags & FLAG_TILES:
+        payload['lines'] = LineStore.from_arrays(*coords)
+        return payload
+
+    grid_spacing, tile_spacing, t = reader.unpack(TILES)
+    boxes = []
+    for _ in range(4):
+        line_sections.append((reader.offset, 8))
+        boxes.append(reader.array('d', n))
+    payload['lines'] = LineStore.from_arrays(*coords, boxes=boxes)
+    xs, ys, firsts, ends, offsets = (reader.array('q', t) for _ in range(5))
+    tiles = {(x, y): (offset, first, end) for x, y, first, end, offset in zip(xs, ys, firsts, ends, offsets)}
+    index = TileIndex(data, grid_spacing, tile_spacing, tiles, line_sections)
+    if lazy_tiles:
+        payload['tiles'] = index
+    else:
+        solids, scenery = dict(), dict()
+        for tile in index:
+            tile_solids, tile_scenery = index.read_cells(tile)
+            solids.update(tile_solids)
+            scenery.update(tile_scenery)
+        payload['grid'] = {'spacing': grid_spacing, 'solids': solids, 'scenery': scenery}
+    return payload
+
+
+def read_cells(reader):
+    m, e = reader.unpack(COUNTS)
+    xs, ys = reader.array('q', m), reader.array('q', m)
+    offsets, line_ids = reader.array('q', m + 1), reader.array('q', e)
+    return {(x, y): set(line_ids[offsets[k]:offsets[k + 1]]) for k, (x, y) in enumerate(zip(xs, ys))}
+
+
+def is_track_file(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def load_payload(path, lazy_tiles: bool = True):
+    """Payload for Track.import_ from a track file, or from a pickled track of older versions"""
+    if is_track_file(path):
+        return read(path, lazy_tiles=lazy_tiles)
+    with open(path, 'rb') as pickled_track:
+        return pickle.load(pickled_track)
+
+
+def convert(pickle_path, output_path=None, tile_spacing: int = None):
+    """Writes a pickled track as a track file, next to it with the .lrt suffix by default
+    tile_spacing: if given, the track file is tiled (see write)"""
+    track = Track()
+    with open(pickle_path, 'rb') as pickled_track:
+        track.import_(pickle.load(pickled_track))
+    output_path = output_path if output_path is not None else Path(f'{pickle_path}.lrt')
+    write(track, output_path, tile_spacing=tile_spacing)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts pickled tracks into track files')
+    parser.add_argument('tracks', nargs='*', help='pickled tracks (default: all the tracks in savedLines/)')
+    parser.add_argument('--tiles', type=int, nargs='?', const=TILE_SPACING, metavar='SPACING',
+                        help=f'write tiled track files, for very large tracks (default tile size: {TILE_SPACING})')
+    args = parser.parse_args()
+
+    paths = args.tracks or [path for path in Path('savedLines').iterdir() if path.is_file()]
+    for path in paths:
+        if str(path).endswith('.journal') or is_track_file(path):  # journals go with their track, see Journal
+            continue
+        print(f'{path} -> {convert(path, tile_spacing=args.tiles)}')
+
+
+if __name__ == "__main__":
+    main()
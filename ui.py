@@ -10,6 +10,10 @@ from dataclasses import dataclass
 from geometry import Vector, distance
 from tools import Tool, Ink
 from help_screen import HelpDisplayer
+from line_layer import LineLayer, RETAINED
+from lod import LevelOfDetail
+from raster import RasterLayer
+from viewport import Viewport
 
 
 @dataclass
@@ -100,11 +104,17 @@ class UI:
         self.canvas_center = Vector(600, 300)
         self.canvas_topleft = Vector(0, 0)
         self.canvas_bottomright = Vector(1200, 600)
+        self.part_start, self.part_direction = Vector(0, 0), Vector(0, 0)  # see draw_parts
 
         self.temp_message = ''
         self.help_popup = False
         self.help_index = 1
         self.helpscreen = HelpDisplayer(self.canvas)
+        self.viewport = Viewport()  # track lines in view, see draw_lines
+        self.lod = LevelOfDetail()  # simplified track, drawn when zoomed out
+        self.raster = RasterLayer(self.canvas)  # image tiles of the track lines, drawn when all are rendered
+        self.line_layer = LineLayer(self.canvas)  # items of the track lines, see redraw_all
+        self.status_text = None  # item of the status text, kept from one frame to the next
 
         self.show_lines = True
         self.show_vector = False
@@ -179,7 +189,7 @@ class UI:
 
         def last_line():
             if self.app.player.is_paused and len(self.app.track.lines) > 0:
-                self.app.player.panPos = self.app.track.lines[-1].r2 - self.canvas_center
+                self.app.player.panPos = self.app.track.lines.last().r2 - self.canvas_center
 
         def follow_rider():
             self.app.player.follow = not self.app.player.follow
@@ -221,7 +231,8 @@ class UI:
                 Command('▶⏸', self.app.player.play_pause, 'Play/Pause (Space or P)'),
                 Command('\u23EE\u25B6', self.app.player.play_from_beginning, 'Play from Beginning (Ctrl+P)'),
                 # Command('⏹', self.app.player.stop, 'Stop (Space)'),
-                Command('👣', self.app.world.step_forward, 'Step (T)'),
+                Command('👣', self.app.step_forward, 'Step (T)'),
+                Command('\u23EA', self.app.player.step_backward, 'Step back (Shift+T)'),
                 Command('\u21BA', self.app.reset_rider, 'Reset Position (R)'),
                 Command('\u2691', self.app.player.set_flag, 'Flag position (F)'),
                 Command('\u2691\u274C', self.app.player.reset_flag, 'Reset Flag (Ctrl+F)'),
@@ -276,6 +287,17 @@ class UI:
                         cmd.selector_group[cmd.label] = btn
 
 
+        # Scrub bar: seek any frame of the run so far
+        def scrub(value):
+            if int(float(value)) != self.app.simulation.frame:
+                self.app.player.seek(int(float(value)))
+
+        scrub_frame = ttk.Frame(self.root, padding=1)
+        scrub_frame.pack(side="top", fill="x")
+        self.scrub_bar = ttk.Scale(scrub_frame, from_=0, to=1, orient=tk.HORIZONTAL, command=scrub)
+        self.scrub_bar.pack(fill="x", padx=5)
+        ToolTip(self.scrub_bar, 'Scrub through the frames of the run', 300)
+
         canvas_frame = ttk.Frame(self.root, padding=1)
         canvas_frame.pack(side="top", fill="both", expand=True)
 
@@ -286,7 +308,9 @@ class UI:
 
             if c == "t":
                 if self.app.player.is_paused:
-                    self.app.world.step_forward()
+                    self.app.step_forward()
+            elif c == "T":
+                self.app.player.step_backward()
             elif c == "p":
                 self.app.player.play_pause()
             elif c == " ":
@@ -396,7 +420,9 @@ class UI:
     # CANVAS
     #####
     def redraw_all(self):
-        self.canvas.delete(tk.ALL)
+        """Track lines and the status text are retained items, updated in place (see LineLayer):
+        everything else is drawn again on each frame"""
+        self.canvas.delete(f'!{RETAINED}')
 
         def draw_lines(line_sequence):
             for (pt1, pt2) in line_sequence:
@@ -423,9 +449,13 @@ class UI:
             draw_lines(track_drawing_data['grid_hlines'])
             draw_rectangles(track_drawing_data['grid_cells_with_lines'], fill_colour='yellow')
             draw_rectangles(track_drawing_data['grid_cells_with_rider'])
+            self.canvas.tag_lower(f'!{RETAINED}')  # under the lines
 
         if self.show_lines:
             self.draw_lines()
+        else:
+            self.line_layer.clear()
+            self.raster.hide()
         if self.show_points:
             self.draw_points()
 
@@ -438,23 +468,26 @@ class UI:
             self.draw_collisions()
         if self.show_status:
             self.status_display()
+        elif self.status_text is not None:
+            self.canvas.delete(self.status_text)
+            self.status_text = None
         if self.help_popup:
             self.helpscreen.show(self.help_index, self.canvas_center)
 
     def draw_lines(self):
         width = 1 if self.thin_lines else 3 * self.app.player.zoom
-
-        for line in self.app.track.get_lines_between(self.canvas_topleft, self.canvas_bottomright):
-            a, b = self.app.player.adjust_pz(line.r1), self.app.player.adjust_pz(line.r2)
-            color = "black"
-            arrow = None
-            if line.ink == Ink.Scene and self.app.player.is_paused:
-                color = "green"
-            elif line.ink == Ink.Acc and self.app.player.is_paused:
-                color = "red"
-                arrow = tk.LAST
-            self.canvas.create_line(a.x, a.y, b.x, b.y, width=width,
-                               caps=tk.ROUND, fill=color, arrow=arrow)
+        player = self.app.player
+        if self.lod.band_of(player.zoom) is not None:
+            self.raster.hide()
+            self.line_layer.set_hidden(False)
+            self.line_layer.update_lod(self.app.track, self.lod, player.cam, player.zoom, self.canvas_center,
+                                       player.is_paused, width)
+        elif self.raster.update(self.app.track, player.cam, player.zoom, self.canvas_center, player.is_paused, width):
+            self.line_layer.set_hidden(True)  # tiles of the whole view are rendered
+        else:
+            self.line_layer.set_hidden(False)
+            self.viewport.update(self.app.track, player.cam, player.zoom, self.canvas_center)
+            self.line_layer.update(self.viewport, player.is_paused, width)
 
         if self.app.rider.onSled:  # Display sled string
             for line in self.app.rider.sledString:
@@ -474,43 +507,40 @@ class UI:
         #        x, y = pnt.x, pnt.y
         #        if is_in_region((x,y), vector(-r,-r), canvas.data.center*2+vector(r,r)):
         #            canvas.create_oval((x-r, y-r), (x+r, y+r))
-        for line in self.app.track.lines:
-            pnt = self.app.player.adjust_pz(line.r1)
-            x, y = pnt.x, pnt.y
-            self.canvas.create_oval((x - r, y - r), (x + r, y + r), outline="blue", width=3)
-            pnt = self.app.player.adjust_pz(line.r2)
-            x, y = pnt.x, pnt.y
-            self.canvas.create_oval((x - r, y - r), (x + r, y + r), outline="blue", width=3)
+        player = self.app.player
+        self.viewport.update(self.app.track, player.cam, player.zoom, self.canvas_center)
+        x1, y1, x2, y2 = self.viewport.screen_coords()
+        for xs, ys in ((x1, y1), (x2, y2)):
+            for x, y in zip(xs, ys):
+                self.canvas.create_oval((x - r, y - r), (x + r, y + r), outline="blue", width=3)
 
     def draw_flag(self):
-        parts = self.app.player.flagged_rider.flag_drawing_vectors
-        bosh = self.app.player.flagged_rider.boshParts
-        for i in range(len(parts)):
-            part = parts[i]  # part contains tuples of line segments and stuff
-            point0, point1 = bosh[i]  # each value has two Point objects
-            angle = (point1.r - point0.r).get_angle()
-            for shape in part:  # segment: tuple of line properties for rendering
-                shape.render(point0.r, angle, self.app)
+        rider = self.app.player.flagged_rider
+        self.draw_parts(rider.flag_drawing_vectors, rider.boshParts)
 
     def draw_scarf(self, c):
         color = c
-        w = 4 * self.app.player.zoom
+        zoom, cam, center = self.app.player.zoom, self.app.player.cam, self.canvas_center
+        w = 4 * zoom
         for line in self.app.rider.scarfCnstr:
             color = "white" if color == c else c
-            pnt1, pnt2 = self.app.player.adjust_pz(line.pnt1.r), self.app.player.adjust_pz(line.pnt2.r)
-            self.canvas.create_line([(pnt1.x, pnt1.y), (pnt2.x, pnt2.y)],
-                               width=w, fill=color, capstyle=tk.BUTT)
+            r1, r2 = line.pnt1.r, line.pnt2.r
+            self.canvas.create_line((r1.x - cam.x) * zoom + center.x, (r1.y - cam.y) * zoom + center.y,
+                                    (r2.x - cam.x) * zoom + center.x, (r2.y - cam.y) * zoom + center.y,
+                                    width=w, fill=color, capstyle=tk.BUTT)
 
     def draw_rider(self):
         self.draw_scarf("red")
-        parts = self.app.rider.drawing_vectors
-        bosh = self.app.rider.boshParts
-        for i in range(len(parts)):
-            part = parts[i]  # part contains tuples of line segments and stuff
-            point0, point1 = bosh[i]  # each value has two Point objects
-            angle = (point1.r - point0.r).get_angle()
-            for shape in part:  # segment: tuple of line properties for rendering
-                shape.render(point0.r, angle, self.app)
+        self.draw_parts(self.app.rider.drawing_vectors, self.app.rider.boshParts)
+
+    def draw_parts(self, parts, bosh):
+        """Draws each part (shapes turning together, see Part) from the two points it hangs on.
+        The points are read into the same two Vectors for every part"""
+        start, direction = self.part_start, self.part_direction
+        for part, (point0, point1) in zip(parts, bosh):
+            point0.r_into(start)
+            point1.r_into(direction).iadd_scaled(start, -1)
+            part.render(start, direction.get_angle(), self.app)  # all its shapes, with one transform
 
     def draw_vectors(self):
         #    for pnt in canvas.rider.points:
@@ -556,15 +586,22 @@ class UI:
 
         line_count = len(self.app.track.lines)
         speed = f'{self.app.rider.speed:.1f} pixels/frame' if not self.app.player.is_paused else ''
+        frame = self.app.simulation.frame
 
-        self.canvas.create_text(
-            5, 0, anchor="nw",
-            text=f'{message}\n{tmp_msg}{fps:.0f} fps\n{line_count} lines in track\n{speed}'
-        )
+        text = f'{message}\n{tmp_msg}{fps:.0f} fps\n{line_count} lines in track\nFrame {frame}\n{speed}'
+        if self.status_text is None:
+            self.status_text = self.canvas.create_text(5, 0, anchor="nw", tags=RETAINED)
+        self.canvas.itemconfigure(self.status_text, text=text)
+        self.canvas.tag_raise(self.status_text)
 
     #####
     # Misc
     #####
+    def update_scrub_bar(self):
+        """Scrub bar spans the frames simulated so far, and follows the rider"""
+        self.scrub_bar.configure(to=max(1, self.app.simulation.max_frame))
+        self.scrub_bar.set(self.app.simulation.frame)
+
     def update_cursor(self):
         tools_to_cur = {
             'default': 'arrow',
@@ -0,0 +1,55 @@
+""" In this module:
+Class Viewport
+"""
+
+from array import array
+from operator import itemgetter
+
+
+class Viewport:
+    """The track lines in view, and their endpoints on screen, cached while the view and the track do not change
+    (a paused frame with nobody editing reuses everything).
+    Screen coordinates are computed for all the visible lines at once, as arrays in the order of ids:
+    the endpoints are gathered from the arrays of the LineStore in one step, then mapped by
+    screen = (world - cam) * zoom + center, without any Vector. They are only computed when asked for.
+    margin: how far beyond the canvas lines count as visible, as a fraction of its size"""
+    def __init__(self, margin: float = 0.25):
+        self.margin = margin
+        self.view = None  # (cam x, cam y, zoom, center x, center y)
+        self.version = 0  # changes each time the visible lines do
+        self.ids = ()  # IDs of the visible lines, sorted
+        self.track = None
+        self.stale = True  # the track changed since ids were found
+        self._screen = None  # (x1, y1, x2, y2) arrays for the current view, see screen_coords
+
+    def __len__(self):
+        return len(self.ids)
+
+    def line_edited(self, line):
+        """Edit listener of the track"""
+        self.stale = True
+
+    def update(self, track, cam, zoom: float, center):
+        """Finds the lines in view, unless neither the view nor the track changed. Returns whether anything did"""
+        view = (cam.x, cam.y, zoom, center.x, center.y)
+        if view == self.view and track is self.track and not self.stale:
+            return False
+        reach = center / zoom * (1 + self.margin)
+        self.ids = tuple(sorted(track.get_line_ids_between(cam - reach, cam + reach)))
+        self.view, self.track, self.stale = view, track, False
+        self._screen = None
+        self.version += 1
+        return True
+
+    def screen_coords(self):
+        """x1, y1, x2, y2 on screen of the visible lines, in the order of ids"""
+        if self._screen is None:
+            cam_x, cam_y, zoom, center_x, center_y = self.view
+            lines = self.track.lines
+            gather = itemgetter(*self.ids) if len(self.ids) > 1 else lambda values: [values[i] for i in self.ids]
+            self._screen = tuple(
+                array('d', [(value - offset) * zoom + center for value in gather(values)])
+                for values, offset, center in ((lines.x1, cam_x, center_x), (lines.y1, cam_y, center_y),
+                                               (lines.x2, cam_x, center_x), (lines.y2, cam_y, center_y))
+            )
+        return self._screen
@@ -1,72 +1,111 @@
 
 
 import copy
+from array import array
 
-from geometry import Point, Line, Vector, distance
+from geometry import Point, PointArray, Line, Vector, distance
+from line_store import LineStore
+from broad_phase import BroadPhase, BroadPhaseStats
 from tool_helpers import Ink
 
 factor = 10
 
 class World:
-    def __init__(self, app):
-        self.app = app
+    """Physical constants and laws of the world.
+    Knows nothing about the App: the rider and the track to collide with are given on each step"""
+    def __init__(self, grav: float = 30.0 / 1000 * factor, drag: float = 0.9999999 ** factor,
+                 acc: float = 0.1 * factor):
         self.timeDelta = 16  # Target interval between frames. 16ms -> 62.5fps
-        self.grav = Vector(0, 30.0 / 1000 * factor)  # pixels per frame**2
-        self.drag = 0.9999999 ** factor
-        self.acc = 0.1 * factor  # acceleration line constant
+        self.grav = Vector(0, grav)  # pixels per frame**2
+        self.drag = drag
+        self.acc = acc  # acceleration line constant
         self.epsilon = 0.00000000001  # larger than floating point errors
         self.lineThickness = 0.001
         self.maxiter = 100
+        self.broadPhaseMargin = 10  # pixels around the swept box of a rider, for constraints moving its points
+        self.broadPhaseStats = BroadPhaseStats()
+        self.collisionPoints = []
 
-    def step_forward(self):
-        if self.app.ui.show_collisions:
+    def step_forward(self, riders, track, record_collisions=False, queried_cells=None):
+        """Moves the riders one frame forward, colliding with the solid lines of the track.
+        Each phase runs over all the riders at once: points sharing arrays (see RiderBatch) are integrated
+        together, then constraints and collisions go through flat lists over all the riders.
+        Riders do not interact, so each one ends up where it would on its own.
+        queried_cells: if given, a set the grid cells looked up for collisions are added to"""
+        if record_collisions:
             self.collisionPoints = []
 
-        for pnt in self.app.rider.points:  # first, update points based on inertia, gravity, and drag
-            pnt.r, pnt.r0 = self.free_fall(pnt), pnt.r
-        for pnt in self.app.rider.scarf:  # scarves are special :|
-            pnt.r, pnt.r0 = self.free_fall(pnt, mass=0.5), pnt.r
+        for body in {id(rider.body): rider.body for rider in riders}.values():
+            self.free_fall(body)  # first, update points based on inertia, gravity, and drag
 
         # Acceleration lines rider collided with in last round now take effect
-        for pnt, lines in self.app.rider.accQueueNow.items():
-            for line in lines:
-                pnt.r += (line.r2 - line.r1).normalize() * self.acc
-        self.app.rider.accQueueNow, self.app.rider.accQueuePast = dict(), self.app.rider.accQueueNow
+        for rider in riders:
+            self.accelerate(rider.body, rider.accQueueNow, track.lines)
+            rider.accQueueNow, rider.accQueuePast = dict(), rider.accQueueNow
 
+        # a tiled track only has the tiles around what is looked at: those of every rider, loaded together
+        track.load_around([rider.points for rider in riders])
+
+        # candidate lines of the frame, gathered once per rider
+        broad_phases = [BroadPhase(track.collision_grid, rider.points, self.broadPhaseMargin, queried_cells, self.broadPhaseStats)
+                        for rider in riders]
+        legs = [cnstr for rider in riders for cnstr in rider.legsC]
+        points = [(rider, pnt, broad_phase) for rider, broad_phase in zip(riders, broad_phases) for pnt in rider.points]
         for _ in range(10):
             # collisions get priority to prevent phasing through lines
-            for cnstr in self.app.rider.legsC:
+            for cnstr in legs:
                 cnstr.resolve(neg_factor_only=True)
-            if self.app.rider.onSled:
-                for cnstr in self.app.rider.slshC:
-                    cnstr.check_endurance(self.app.rider)
-            for cnstr in self.app.rider.constraints:
+            for rider in riders:
+                if rider.onSled:
+                    for cnstr in rider.slshC:
+                        cnstr.check_endurance(rider)
+            for cnstr in [cnstr for rider in riders for cnstr in rider.constraints]:  # riders may have fallen
                 cnstr.resolve()
-            for pnt in self.app.rider.points:
-                accLines = self.resolve_collision(pnt)
+            for rider, pnt, broad_phase in points:
+                accLines = self.resolve_collision(pnt, rider, track, record_collisions, queried_cells, broad_phase)
                 if len(accLines) > 0:  # contains lines
-                    self.app.rider.accQueueNow[pnt] = accLines
+                    rider.accQueueNow[pnt.i] = accLines
 
-        for cnstr in self.app.rider.scarfCnstr:
+        for cnstr in [cnstr for rider in riders for cnstr in rider.scarfCnstr]:
             cnstr.resolve(static_p1=True)
 
-    def free_fall(self, pnt, mass: float = 1):
+    def free_fall(self, points: PointArray):
         """All points are independent, acting only on inertia, drag, and gravity
-        The velocity is implied with the previous position"""
-        velocity = pnt.r - pnt.r0
-        return pnt.r + velocity * self.drag * mass + self.grav  # TODO: Drag should be with speed²!
+        The velocity is implied with the previous position. All points are integrated at once"""
+        drag, gx, gy = self.drag, self.grav.x, self.grav.y  # TODO: Drag should be with speed²!
+        x = array('d', [r + (r - r0) * drag * m + gx for r, r0, m in zip(points.x, points.x0, points.mass)])
+        y = array('d', [r + (r - r0) * drag * m + gy for r, r0, m in zip(points.y, points.y0, points.mass)])
+        points.x0, points.y0 = points.x, points.y
+        points.x, points.y = x, y
+
+    def accelerate(self, points: PointArray, acc_queue, lines: LineStore):
+        """Pushes the points along the acceleration lines they touched
+        acc_queue: point index -> IDs of acceleration lines. Those erased since they were touched are skipped"""
+        for i, line_ids in acc_queue.items():
+            for line_id in line_ids:
+                direction = lines.directions.get(line_id)
+                if direction is None:
+                    continue
+                dx, dy = direction
+                points.x[i] += dx * self.acc
+                points.y[i] += dy * self.acc
 
-    def resolve_collision(self, pnt):
+    def resolve_collision(self, pnt, rider, track, record_collisions=False, queried_cells=None, broad_phase=None):
         """takes a solid point, finds and resolves collisions,
-        and returns the acceleration lines it collided with"""
+        and returns the IDs of the acceleration lines it collided with
+        broad_phase: candidate lines of the frame, the grid is queried directly if None"""
         hasCollided = True
         maxiter = self.maxiter
         accLines = set()
 
         while hasCollided and maxiter > 0:
             hasCollided = False
-            lines = self.app.track.grid.get_solid_lines(pnt)  # get the lines the point may collide with
-            collidingLines, collisionPoints, intersections = self.get_colliding_lines(pnt, lines)
+            # get the lines the point may collide with
+            if broad_phase is not None:
+                line_ids = broad_phase.get_solid_lines(pnt)
+            else:
+                line_ids = track.collision_grid.get_solid_lines(pnt, queried_cells)
+            collidingLines, collisionPoints, intersections = self.get_colliding_lines(pnt, line_ids, track.lines)
 
             if len(collisionPoints) == 0:  # no more collisions
                 break
@@ -79,31 +118,93 @@ class World:
                 collidingLine = collidingLines[0]
             # set future point to above point, evaluate acc line if necessary
             pnt.r = futurePoint
-            if collidingLine.ink == Ink.Acc:
+            if track.lines.ink(collidingLine) == Ink.Acc:
                 accLines.add(collidingLine)
 
             hasCollided = True
             maxiter -= 1
-            if self.app.ui.show_collisions:
+            if record_collisions:
                 self.collisionPoints += [copy.copy(futurePoint)]
-            if pnt == self.app.rider.points[0]:
-                self.app.rider.kill_bosh()  # LINE RIDER'S BUTT IS SENSITIVE. TOUCH IT AND HE FALLS OFF THE SLED.
+            if pnt == rider.points[0]:
+                rider.kill_bosh()  # LINE RIDER'S BUTT IS SENSITIVE. TOUCH IT AND HE FALLS OFF THE SLED.
         return accLines
 
-    def get_colliding_lines(self, pnt, lines):
-        """"returns a list of the lines "pnt" actually collides with
+    def get_colliding_lines(self, pnt, line_ids, lines: LineStore):
+        """"returns a list of the IDs of the lines "pnt" actually collides with
             and the respective intersection points"""
-        collisionPoints = []
-        collidingLines = []
-        intersections = []
-        for line in lines:
-            point = self.get_collision(pnt, line)  # future position of pnt, intersection pt
-            if point is not None:
-                collidingLines += [line]
-                collisionPoints += [point[0]]
-                intersections += [point[1]]
+        collisions = self.collide_batch(pnt.r, pnt.r0, line_ids, lines)
+        collidingLines = [line_id for line_id, _, _ in collisions]
+        collisionPoints = [futurePos for _, futurePos, _ in collisions]
+        intersections = [intersection for _, _, intersection in collisions]
         return collidingLines, collisionPoints, intersections
 
+    def collide_batch(self, r, r0, line_ids, lines: LineStore):
+        """Narrow phase of one point against a batch of lines, read from the coordinate arrays of the store
+        (endpoints and cached bounding boxes).
+        Same maths as get_collision (and same results, to the bit), but inlined on floats:
+        no Line nor Vector is built unless there is a collision.
+        Returns a list of (line ID, futurePos, intersection)"""
+        px, py, qx, qy = r.x, r.y, r0.x, r0.y
+        thickness = self.lineThickness + self.epsilon
+        tolerance = self.epsilon / 100  # see almost_equal
+
+        # trajectory from r to r0, in the form of ax+by=c
+        a1, b1 = qy - py, px - qx
+        c1 = a1 * px + b1 * py
+        tx1, tx2, ty1, ty2 = min(px, qx), max(px, qx), min(py, qy), max(py, qy)
+
+        X1, Y1, X2, Y2 = lines.x1, lines.y1, lines.x2, lines.y2
+        XMIN, XMAX, YMIN, YMAX = lines.xmin, lines.xmax, lines.ymin, lines.ymax
+        collisions = []
+        for k in line_ids:
+            # A collision needs the trajectory to reach the line, or to end closer than its thickness
+            x1, x2, y1, y2 = XMIN[k], XMAX[k], YMIN[k], YMAX[k]
+            if x1 - thickness > tx2 or x2 + thickness < tx1 or y1 - thickness > ty2 or y2 + thickness < ty1:
+                continue
+            lx1, ly1, lx2, ly2 = X1[k], Y1[k], X2[k], Y2[k]
+            a2, b2 = ly2 - ly1, lx1 - lx2  # linear equation, see Line.linear_equation
+            c2 = a2 * lx1 + b2 * ly1
+
+            # closest point on line to r, see closest_point_on_line
+            c3 = -b2 * px + a2 * py
+            d = a2 * a2 - b2 * -b2
+            if d == 0:
+                fx, fy = px, py
+            else:
+                fx, fy = (a2 * c2 - b2 * c3) / d, (a2 * c3 - -b2 * c2) / d
+
+            # intersection of the trajectory with the line, see intersect_point
+            d = a1 * b2 - b1 * a2
+            if d != 0:
+                ix, iy = (c1 * b2 - b1 * c2) / d, (a1 * c2 - c1 * a2) / d
+                if ((tx1 <= ix <= tx2 and ty1 <= iy <= ty2)
+                        or (tx1 == tx2 and abs(tx1 - ix) < tolerance and ty1 <= iy <= ty2)
+                        or (ty1 == ty2 and abs(ty1 - iy) < tolerance and tx1 <= ix <= tx2)) and (
+                        (x1 <= ix <= x2 and y1 <= iy <= y2)
+                        or (x1 == x2 and abs(x1 - ix) < tolerance and y1 <= iy <= y2)
+                        or (y1 == y2 and abs(y1 - iy) < tolerance and x1 <= ix <= x2)):
+                    dx, dy = fx - px, fy - py
+                    if (dx, dy) != (0, 0):  # project position onto line
+                        magnitude = (dx ** 2 + dy ** 2) ** 0.5
+                        fx, fy = fx + dx / magnitude * thickness, fy + dy / magnitude * thickness
+                    collisions += [(k, Vector(fx, fy), Vector(ix, iy))]
+                    continue
+
+            # distance from the line, see distance_from_line
+            if ((x1 <= fx <= x2 and y1 <= fy <= y2)
+                    or (x1 == x2 and abs(x1 - fx) < tolerance and y1 <= fy <= y2)
+                    or (y1 == y2 and abs(y1 - fy) < tolerance and x1 <= fx <= x2)):
+                dist = ((px - fx) ** 2 + (py - fy) ** 2) ** 0.5
+            else:
+                dist = min(((px - lx1) ** 2 + (py - ly1) ** 2) ** 0.5, ((px - lx2) ** 2 + (py - ly2) ** 2) ** 0.5)
+            if dist < self.lineThickness:  # if inside line, same as above except reverse direction of epsilon
+                dx, dy = px - fx, py - fy
+                if (dx, dy) != (0, 0):
+                    magnitude = (dx ** 2 + dy ** 2) ** 0.5
+                    fx, fy = fx + dx / magnitude * thickness, fy + dy / magnitude * thickness
+                collisions += [(k, Vector(fx, fy), Vector(px, py))]  # r is in the line: it's the intersection
+        return collisions
+
     def get_collision(self, pnt: Point, line: Line):
         """Returns the position after collision (if it exists)
         Returns: